@@ -0,0 +1,117 @@
+from pathlib import Path
+
+import numpy as np
+
+from catalog import top_k_indices
+
+
+class RandomProjectionIndex:
+    """
+    Indice approssimato (LSH a proiezioni casuali) sugli embedding normalizzati dei film.
+
+    Ogni tabella assegna a un film il codice dei segni delle sue proiezioni su
+    `n_bits` iperpiani casuali: film con correlazione alta finiscono spesso nello
+    stesso bucket. Una query raccoglie i film dei bucket visitati in tutte le
+    tabelle (multi-probe: oltre al proprio bucket, quelli ottenuti invertendo i
+    bit con la proiezione più vicina a zero) e li riordina con il prodotto
+    scalare esatto. Più tabelle e più probe = recall più alto e query più lente.
+
+    Gli embedding devono essere centrati e normalizzati per riga (`normalize_rows`),
+    così il prodotto scalare è la correlazione usata anche da `top_k_neighbors`.
+    """
+
+    def __init__(self,
+                 embeddings: np.ndarray,
+                 planes: np.ndarray,
+                 keys: np.ndarray,
+                 items: np.ndarray,
+                 probes: int = 1):
+        self.embeddings = embeddings  # (N, d)
+        self.probes = probes          # probe per tabella di default
+        self.planes = planes          # (tabelle, bit, d)
+        # tutte le tabelle in un unico array ordinato: chiave = tabella << bit | codice
+        self.keys = keys              # (tabelle * N,) chiavi ordinate
+        self.items = items            # (tabelle * N,) film di ogni chiave
+        self.n_tables, self.n_bits, _ = planes.shape
+        self.weights = np.left_shift(np.uint32(1), np.arange(self.n_bits, dtype=np.uint32))
+        self.table_offset = (np.arange(self.n_tables, dtype=np.uint32) << np.uint32(self.n_bits))[:, None]
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, n_tables: int, n_bits: int, seed: int = 42) -> "RandomProjectionIndex":
+        """
+        :param embeddings: embedding normalizzati (N, d)
+        :param n_tables: tabelle hash indipendenti
+        :param n_bits: bit per codice (bucket medi da N / 2**n_bits film)
+        """
+        rng = np.random.default_rng(seed)
+        planes = rng.standard_normal((n_tables, n_bits, embeddings.shape[1])).astype(np.float32)
+        weights = np.left_shift(np.uint32(1), np.arange(n_bits, dtype=np.uint32))
+
+        # (tabelle, N): codice di ogni film in ogni tabella, con la tabella nei bit alti
+        proj = np.einsum("tbd,nd->tnb", planes, np.asarray(embeddings, dtype=np.float32))
+        codes = (proj > 0).astype(np.uint32) @ weights
+        codes += (np.arange(n_tables, dtype=np.uint32) << np.uint32(n_bits))[:, None]
+
+        keys = codes.ravel()
+        order = np.argsort(keys, kind="stable")
+        items = (order % embeddings.shape[0]).astype(np.int32)
+        return cls(embeddings, planes, keys[order], items)
+
+    def save(self, path: Path):
+        np.savez(path, planes=self.planes, keys=self.keys, items=self.items)
+
+    @classmethod
+    def load(cls, path: Path, embeddings: np.ndarray, probes: int = 1) -> "RandomProjectionIndex":
+        with np.load(path) as f:
+            return cls(embeddings, f["planes"], f["keys"], f["items"], probes=probes)
+
+    def candidates(self, vector: np.ndarray, probes: int) -> np.ndarray:
+        """
+        Film nei bucket visitati: `probes` bucket per tabella (1 = solo il proprio).
+        """
+        proj = self.planes @ np.asarray(vector, dtype=np.float32)  # (tabelle, bit)
+        base = (proj > 0).astype(np.uint32) @ self.weights
+        probes = max(1, min(int(probes), self.n_bits + 1))
+
+        # bucket vicini: si inverte un bit alla volta, dal meno "sicuro"
+        flips = np.argsort(np.abs(proj), axis=1)[:, :probes - 1]
+        probe_keys = np.concatenate([base[:, None], base[:, None] ^ self.weights[flips]], axis=1)
+        probe_keys = (probe_keys + self.table_offset).ravel()
+
+        # intervalli [lo, hi) dei bucket nell'array ordinato, espansi senza cicli Python
+        lo = np.searchsorted(self.keys, probe_keys, side="left")
+        hi = np.searchsorted(self.keys, probe_keys, side="right")
+        lengths = hi - lo
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int32)
+        starts = np.repeat(lo - (np.cumsum(lengths) - lengths), lengths)
+        found = self.items[starts + np.arange(total)]
+
+        # deduplica con una maschera sul catalogo (più economica di np.unique)
+        seen = np.zeros(self.embeddings.shape[0], dtype=bool)
+        seen[found] = True
+        return np.flatnonzero(seen)
+
+    def search(self, vector: np.ndarray, k: int, probes: int, exclude: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Primi k film (approssimati) per correlazione con `vector`.
+
+        :return: (indici di riga, correlazioni) in ordine decrescente
+        """
+        cand = self.candidates(vector, probes)
+        if exclude is not None:
+            cand = cand[cand != exclude]
+        sc = self.embeddings[cand] @ np.asarray(vector, dtype=self.embeddings.dtype)
+        best = top_k_indices(sc, k)
+        return cand[best], sc[best]
+
+    def similar(self, row: int, top_k: int, probes: int | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Stessa interfaccia di `NeighborIndex.similar`: vicini del film alla riga `row`
+        (escluso se stesso, solo correlazione positiva).
+        """
+        probes = self.probes if probes is None else probes
+        idx, sc = self.search(self.embeddings[row], top_k, probes, exclude=row)
+        keep = sc > 0
+        return idx[keep], sc[keep]
@@ -0,0 +1,100 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import hashlib
+import json
+import threading
+import time
+
+from prefs import LIST_FIELDS, SCORING_FIELDS
+
+
+def prefs_key(pref: Dict[str, Any]) -> str:
+    """
+    Hash canonico di un dizionario di preferenze normalizzate.
+
+    Entrano solo i campi usati dallo scoring (SCORING_FIELDS): campi extra
+    salvati con l'utente non dividono la cache e qualunque valore abbiano
+    non arriva mai a `set()`. Le liste note (generi, registi) sono trattate
+    come insiemi di stringhe: lo scoring non dipende né dall'ordine né dai
+    duplicati, quindi profili equivalenti condividono la stessa chiave.
+    """
+    canon = {}
+    for k in SCORING_FIELDS:
+        if k not in pref:
+            continue
+        v = pref[k]
+        if k in LIST_FIELDS:
+            v = sorted({str(x) for x in v}) if isinstance(v, (list, tuple)) else []
+        canon[k] = v
+    payload = json.dumps(canon, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    """
+    Cache LRU con scadenza (TTL) e contatori, sicura tra thread.
+
+    :param maxsize: elementi massimi; oltre si scarta il meno usato di recente
+    :param ttl: secondi di validità di un elemento (<= 0 = nessuna scadenza)
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get(self, key: Hashable, valid: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Valore in cache per `key`, o None.
+
+        :param valid: se indicato, un valore presente ma che non lo soddisfa
+                      conta come miss (es. lista troppo corta per il top_k chiesto)
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl > 0 and time.monotonic() - item[0] > self.ttl:
+                del self._data[key]
+                self.expirations += 1
+                item = None
+            if item is None or (valid is not None and not valid(item[1])):
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._data)
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
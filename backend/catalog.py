@@ -0,0 +1,492 @@
+from typing import Dict, Any, Tuple
+
+import bisect
+import hashlib
+import unicodedata
+
+import numpy as np
+import pandas as pd
+import config
+from genres import GENRES, GENRE_BIT, genre_mask, pack_genres, popcount
+
+# anno sentinella per i film senza release_date (mai >= min_release_year)
+YEAR_MISSING = np.iinfo(np.int16).min
+
+# Codici (bit) dei motivi di novità restituiti da novelty_mask
+NOVELTY_GENRE = 1
+NOVELTY_DIRECTOR = 2
+NOVELTY_RUNTIME = 4
+NOVELTY_REASONS = [
+    (NOVELTY_GENRE, "genere fuori profilo"),
+    (NOVELTY_DIRECTOR, "regista fuori preferiti"),
+    (NOVELTY_RUNTIME, "runtime fuori tolleranza"),
+]
+
+
+def top_k_indices(values: np.ndarray, k: int, largest: bool = True) -> np.ndarray:
+    """
+    Indici dei k valori più grandi (o più piccoli) di `values`, già ordinati.
+
+    Usa `argpartition` per isolare i candidati in O(n) e ordina solo quei k
+    elementi: costo O(n + k log k) invece di un sort completo. A parità di
+    valore vince l'indice più basso, come in un sort stabile.
+
+    :param values: array 1-D dei valori
+    :param k: numero di indici da restituire
+    :param largest: True per l'ordine decrescente, False per quello crescente
+    :return: array di indici (al più k), ordinati per valore
+    """
+    values = np.asarray(values)
+    n = values.size
+    k = min(int(k), n)
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    keys = values if not largest else -values
+    if k < n:
+        # soglia = k-esimo valore; i pareggi sulla soglia vanno presi in ordine di indice
+        kth = keys[np.argpartition(keys, k - 1)[k - 1]]
+        above = np.flatnonzero(keys < kth)
+        ties = np.flatnonzero(keys == kth)[:k - above.size]
+        cand = np.concatenate([above, ties])
+    else:
+        cand = np.arange(n)
+    return cand[np.argsort(keys[cand], kind="stable")]
+
+
+def top_k_rows(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Versione per righe di `top_k_indices` (ordine decrescente) su una matrice 2-D.
+
+    Soglia per riga (k-esimo valore), selezione dei valori sopra soglia e dei
+    primi pareggi in ordine di indice, poi sort stabile dei soli k candidati:
+    nessun ciclo Python sulle righe. Per matrici uint8 (ranghi) la soglia si
+    ricava da un istogramma per riga invece che da `np.partition`.
+
+    :param values: matrice (righe, n) dei valori
+    :param k: numero di indici per riga
+    :return: matrice (righe, min(k, n)) di indici di colonna, ordinati per valore
+    """
+    n_rows, n = values.shape
+    k = min(int(k), n)
+    if k <= 0 or n_rows == 0:
+        return np.empty((n_rows, 0), dtype=np.intp)
+
+    if values.dtype == np.uint8:
+        offsets = (np.arange(n_rows, dtype=np.intp) * 256)[:, None]
+        hist = np.bincount((values + offsets).ravel(), minlength=n_rows * 256).reshape(n_rows, 256)
+        from_top = np.cumsum(hist[:, ::-1], axis=1)
+        kth = (255 - np.argmax(from_top >= k, axis=1)).astype(np.uint8)[:, None]
+    else:
+        kth = np.partition(values, n - k, axis=1)[:, n - k:n - k + 1]
+    above = values > kth
+    ties = values == kth
+    room = k - np.count_nonzero(above, axis=1)
+    # righe con più pareggi che posti: solo i primi in ordine di indice
+    # (cumsum sulle sole righe interessate, di solito nessuna con valori float)
+    crowded = np.flatnonzero(np.count_nonzero(ties, axis=1) > room)
+    if crowded.size:
+        ties[crowded] &= np.cumsum(ties[crowded], axis=1, dtype=np.int32) <= room[crowded, None]
+    sel = above | ties
+
+    cand = np.nonzero(sel)[1].reshape(n_rows, k)
+    cand_values = np.take_along_axis(values, cand, axis=1)
+    if cand_values.dtype == np.uint8:
+        cand_values = cand_values.astype(np.int16)
+    order = np.argsort(-cand_values, axis=1, kind="stable")
+    return np.take_along_axis(cand, order, axis=1)
+
+
+def normalize_title(title: Any) -> str:
+    """
+    Chiave di ricerca di un titolo: senza accenti, casefold e spazi compattati.
+    """
+    text = unicodedata.normalize("NFKD", str(title or ""))
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+class TitleIndex:
+    """
+    Indice dei titoli normalizzati -> righe del catalogo.
+
+    Le chiavi sono tenute in una lista ordinata: la ricerca esatta e quella per
+    prefisso sono due `bisect` (O(log n)) invece di una scansione dei titoli.
+    A parità di titolo le righe sono in ordine di movie_id.
+    """
+
+    def __init__(self, titles, movie_ids: np.ndarray):
+        keys = [normalize_title(t) for t in titles]
+        order = sorted(range(len(keys)), key=lambda i: (keys[i], int(movie_ids[i])))
+        self.keys = [keys[i] for i in order]
+        self.rows = np.asarray(order, dtype=np.int32)
+
+    def lookup(self, title: str) -> np.ndarray:
+        """
+        Righe dei film con questo titolo (normalizzato), in ordine di movie_id.
+        """
+        key = normalize_title(title)
+        lo = bisect.bisect_left(self.keys, key)
+        hi = bisect.bisect_right(self.keys, key, lo=lo)
+        return self.rows[lo:hi]
+
+    def search(self, prefix: str, limit: int) -> np.ndarray:
+        """
+        Prime `limit` righe (in ordine alfabetico) dei titoli che iniziano con `prefix`.
+        """
+        key = normalize_title(prefix)
+        lo = bisect.bisect_left(self.keys, key)
+        hi = lo
+        stop = min(lo + max(0, limit), len(self.keys))
+        while hi < stop and self.keys[hi].startswith(key):
+            hi += 1
+        return self.rows[lo:hi]
+
+
+class Catalog:
+    """
+    Catalogo film compilato una sola volta in array NumPy contigui.
+
+    Ogni array ha una riga per film, nello stesso ordine del DataFrame
+    sorgente: le funzioni di ranking restituiscono indici di riga, da usare
+    con `frame.iloc[...]` solo per i risultati effettivamente restituiti.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.frame = frame
+        self.size = len(frame)
+
+        self.movie_id = frame["movie_id"].to_numpy(dtype=np.int32)
+        # lookup movie_id -> riga (-1 = id assente)
+        self.row_of_id = np.full(int(self.movie_id.max(initial=0)) + 1, -1, dtype=np.int32)
+        self.row_of_id[self.movie_id] = np.arange(self.size, dtype=np.int32)
+
+        years = frame["release_date"].dt.year
+        self.year = years.fillna(YEAR_MISSING).to_numpy(dtype=np.int16)
+
+        self.genre_names = [g for g in GENRES if g in frame.columns]
+        self.genres = np.ascontiguousarray(
+            frame[self.genre_names].fillna(0).to_numpy(dtype=np.int8)
+        )
+        # stessi generi impacchettati in una bitmask uint32 per film
+        self.genre_mask = pack_genres(self.genres, self.genre_names)
+
+        # NaN resta NaN: il confronto con la tolleranza lo esclude
+        self.runtime = frame["runtime"].to_numpy(dtype=np.float32)
+        # premi come flag 0/1 (README: 0 nessun premio, 1 premiato): un conteggio
+        # farebbe divergere score_rows (peso * valore) dallo scoring batch, che
+        # codifica il flag in un bit, e oltre 127 andrebbe in overflow in int8
+        self.awards = (frame["awards"].to_numpy(dtype=np.float64) > 0).astype(np.int8)
+
+        # titoli normalizzati -> righe (ricerca esatta e per prefisso)
+        self.titles = TitleIndex(frame["movie_title"], self.movie_id)
+
+        # registi come codici categorici (-1 = regista sconosciuto)
+        codes, uniques = pd.factorize(frame["director"])
+        self.director = codes.astype(np.int32)
+        self.director_index = {name: i for i, name in enumerate(uniques)}
+
+        # matrice generi trasposta (generi x film) per lo scoring batch via matmul
+        self.genres_t = np.ascontiguousarray(self.genres.T, dtype=np.float32)
+        self.genre_bits = np.array([GENRE_BIT[g] for g in self.genre_names], dtype=np.uint32)
+
+        # codice batch = (generi desiderati << 3) | premi << 2 | regista << 1 | durata;
+        # tabella codice -> punteggio sommata nello stesso ordine di `score`
+        c = np.arange((len(self.genre_names) + 1) << 3)
+        self.batch_excluded = c.size
+        self.batch_scores = np.append(
+            (c >> 3).astype(np.float64) + ((c >> 2) & 1) * config.AWARD_WEIGHT
+            + ((c >> 1) & 1) * config.DIRECTOR_WEIGHT + (c & 1) * config.RUNTIME_WEIGHT,
+            -np.inf,
+        )
+        # rango denso (uint8) dei punteggi: stesso ordinamento, pareggi compresi
+        self.batch_ranks = np.unique(self.batch_scores, return_inverse=True)[1].astype(np.uint8)
+
+        # versione del contenuto (array compilati + pesi): cambia solo se cambiano i risultati
+        digest = hashlib.sha1()
+        for arr in (self.movie_id, self.year, self.genre_mask, self.runtime, self.awards, self.director):
+            digest.update(np.ascontiguousarray(arr).tobytes())
+        digest.update(repr((config.AWARD_WEIGHT, config.DIRECTOR_WEIGHT, config.RUNTIME_WEIGHT)).encode())
+        digest.update(repr(list(self.director_index)).encode())
+        self.version = digest.hexdigest()[:16]
+
+    # ---- Compilazione preferenze ----
+    def director_codes(self, names) -> np.ndarray:
+        codes = [self.director_index[d] for d in (names or []) if d in self.director_index]
+        return np.asarray(codes, dtype=np.int32)
+
+    def rows_for_ids(self, movie_ids) -> np.ndarray:
+        """
+        Indici di riga dei film con gli id indicati (-1 per gli id non a catalogo).
+        """
+        ids = np.asarray(movie_ids, dtype=np.int64)
+        out = np.full(ids.shape, -1, dtype=np.int32)
+        ok = (ids >= 0) & (ids < self.row_of_id.size)
+        out[ok] = self.row_of_id[ids[ok]]
+        return out
+
+    # ---- Filtri ----
+    def year_mask(self, pref: Dict[str, Any]) -> np.ndarray:
+        """
+        Maschera booleana dei film con anno di uscita >= min_release_year.
+        """
+        return (self.year != YEAR_MISSING) & (self.year >= pref.get("min_release_year", 0))
+
+    def year_rows(self, pref: Dict[str, Any]) -> np.ndarray:
+        """
+        Indici di riga dei film che rispettano la minima release year richiesta.
+        """
+        return np.flatnonzero(self.year_mask(pref))
+
+    # ---- Scoring ----
+    def score(self, pref: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Calcola il punteggio constraint-based dei film ammessi dalle preferenze.
+
+        Stessa logica di `recommend_movies`: filtro sull'anno, esclusione dei
+        generi vietati, somma dei generi desiderati e bonus per premi, registi
+        graditi e durata entro la tolleranza.
+
+        :param pref: dizionario con le preferenze dell'utente
+        :return: indici di riga dei film ammessi e relativi punteggi (float64)
+        """
+        mask = self.year_mask(pref)
+
+        # rimuovi film con generi vietati
+        vietati = genre_mask(pref.get("generi_vietati"))
+        if vietati:
+            mask &= (self.genre_mask & vietati) == 0
+
+        rows = np.flatnonzero(mask)
+        return rows, self.score_rows(pref, rows)
+
+    def score_rows(self, pref: Dict[str, Any], rows: np.ndarray) -> np.ndarray:
+        """
+        Punteggio constraint-based (float64) delle sole righe indicate, senza filtri:
+        stessi valori di `score` per le righe che li superano.
+        """
+        score = np.zeros(rows.size, dtype=np.float64)
+
+        # punteggio base sui generi desiderati
+        desiderati = genre_mask(pref.get("generi_desiderati"))
+        if desiderati:
+            score += popcount(self.genre_mask[rows] & desiderati)
+
+        # bonus premi
+        if pref.get("prefer_award_winning", False):
+            score += self.awards[rows] * config.AWARD_WEIGHT
+
+        # bonus registi
+        if pref.get("favorite_directors"):
+            liked_dir = np.isin(self.director[rows], self.director_codes(pref["favorite_directors"]))
+            score += liked_dir * config.DIRECTOR_WEIGHT
+
+        # bonus durata
+        if pref.get("preferred_runtime") is not None:
+            delta = np.abs(self.runtime[rows].astype(np.float64) - pref["preferred_runtime"])
+            near = delta <= pref.get("tolleranza_runtime", 15)
+            score += near * config.RUNTIME_WEIGHT
+
+        return score
+
+    def recommend(self, pref: Dict[str, Any], top_k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k film per le preferenze utente, in ordine di punteggio decrescente.
+
+        La selezione è parziale (`top_k_indices`); a parità di punteggio i film
+        restano nell'ordine del catalogo.
+
+        :param pref: dizionario con le preferenze dell'utente
+        :param top_k: numero di film da restituire
+        :return: indici di riga dei film raccomandati e relativi punteggi
+        """
+        rows, score = self.score(pref)
+        order = top_k_indices(score, top_k)
+        return rows[order], score[order]
+
+    def recommend_hybrid(self,
+                         pref: Dict[str, Any],
+                         embeddings: np.ndarray,
+                         query: np.ndarray | None,
+                         top_k: int = 5,
+                         exclude: np.ndarray | None = None,
+                         content_weight: float = config.HYBRID_CONTENT_WEIGHT,
+                         cf_weight: float = config.HYBRID_CF_WEIGHT
+                         ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Top-k ibrido: punteggio constraint-based fuso con la similarità collaborativa
+        rispetto a un film (es. liked_movie), in un solo passaggio sui film ammessi.
+
+        La similarità è il prodotto scalare tra embedding normalizzati (correlazione,
+        come /similar_movies), calcolata solo per le righe che passano i filtri:
+        score = content_weight * punteggio contenuto + cf_weight * similarità.
+
+        :param pref: dizionario con le preferenze dell'utente
+        :param embeddings: matrice (film, componenti) allineata alle righe del catalogo
+                           (righe nulle = film senza embedding, similarità 0)
+        :param query: embedding del film di riferimento (None = solo contenuto)
+        :param top_k: numero di film da restituire
+        :param exclude: righe da escludere (es. il film di riferimento stesso)
+        :return: righe, punteggio fuso, punteggio contenuto e similarità dei film scelti
+        """
+        rows, content = self.score(pref)
+        if exclude is not None and exclude.size:
+            keep = ~np.isin(rows, exclude)
+            rows, content = rows[keep], content[keep]
+
+        if query is None:
+            sim = np.zeros(rows.size, dtype=np.float64)
+        else:
+            sim = (embeddings[rows] @ query).astype(np.float64)
+        blended = content_weight * content + cf_weight * sim
+
+        order = top_k_indices(blended, top_k)
+        return rows[order], blended[order], content[order], sim[order]
+
+    def _batch_codes(self, prefs: list[Dict[str, Any]]) -> np.ndarray:
+        """
+        Codice uint8 per cella (utenti x film): conteggio dei generi desiderati
+        e flag premi / regista gradito / durata, oppure BATCH_EXCLUDED.
+        """
+        n_users = len(prefs)
+        min_year = np.array([p.get("min_release_year", 0) for p in prefs], dtype=np.int64)
+        vietati = np.array([genre_mask(p.get("generi_vietati")) for p in prefs], dtype=np.uint32)
+        desiderati = np.array([genre_mask(p.get("generi_desiderati")) for p in prefs], dtype=np.uint32)
+        awards = np.array([bool(p.get("prefer_award_winning", False)) for p in prefs])
+        runtime = np.array([np.nan if p.get("preferred_runtime") is None else p["preferred_runtime"]
+                            for p in prefs], dtype=np.float64)
+        tol = np.array([p.get("tolleranza_runtime", 15) for p in prefs], dtype=np.float64)
+        fav = np.zeros((n_users, len(self.director_index) + 1), dtype=bool)
+        for u, p in enumerate(prefs):
+            if p.get("favorite_directors"):
+                fav[u, self.director_codes(p["favorite_directors"])] = True
+
+        # generi desiderati: (utenti x generi) @ (generi x film)
+        weights = ((desiderati[:, None] & self.genre_bits) != 0).astype(np.float32)
+        code = (weights @ self.genres_t).astype(np.uint8) << 3
+
+        # flag premi (solo per chi li preferisce) e regista gradito
+        code |= (self.awards.astype(bool) & awards[:, None]).view(np.uint8) << 2
+        code |= fav[:, self.director].view(np.uint8) << 1
+
+        # durata entro tolleranza (NaN = nessuna preferenza); con valori interi
+        # il confronto in float32 è esatto e costa meno della versione float64
+        finite = runtime[~np.isnan(runtime)]
+        if np.all(np.mod(finite, 1) == 0) and np.all(np.mod(tol, 1) == 0) \
+                and np.all(np.abs(finite) < 2 ** 24) and np.all(np.abs(tol) < 2 ** 24):
+            delta = np.abs(self.runtime - runtime.astype(np.float32)[:, None])
+            code |= (delta <= tol.astype(np.float32)[:, None]).view(np.uint8)
+        else:
+            delta = np.abs(self.runtime.astype(np.float64) - runtime[:, None])
+            code |= (delta <= tol[:, None]).view(np.uint8)
+
+        # filtri: anno e generi vietati
+        excluded = (self.year == YEAR_MISSING) | (self.year < min_year[:, None])
+        excluded |= (self.genre_mask & vietati[:, None]) != 0
+        code[excluded] = self.batch_excluded
+        return code
+
+    def score_batch(self, prefs: list[Dict[str, Any]]) -> np.ndarray:
+        """
+        Punteggi constraint-based di più utenti in un solo passaggio matriciale.
+
+        Stessa logica di `score`. I generi desiderati diventano una matrice di
+        pesi utenti x generi moltiplicata per la matrice generi x film; premi,
+        registi graditi e durata sono flag 0/1 per cella. Conteggio generi e flag
+        formano un codice uint8 per cella, tradotto in punteggio da una tabella
+        calcolata con le stesse somme float64 di `score` (risultati identici bit a bit).
+
+        :param prefs: lista di dizionari di preferenze
+        :return: matrice (utenti, film) dei punteggi, -inf per i film esclusi
+        """
+        return self.batch_scores[self._batch_codes(prefs)]
+
+    def recommend_batch(self, prefs: list[Dict[str, Any]], top_k: int = 5) -> list[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Top-k film per ciascun profilo, con lo stesso ranking di `recommend`.
+
+        Gli utenti sono processati a blocchi di al più config.BATCH_MAX_CELLS
+        celle (utenti x film) per limitare la memoria.
+
+        :param prefs: lista di dizionari di preferenze
+        :param top_k: numero di film da restituire per utente
+        :return: lista (una voce per profilo) di indici di riga e punteggi
+        """
+        out = []
+        chunk = max(1, config.BATCH_MAX_CELLS // max(self.size, 1))
+        for start in range(0, len(prefs), chunk):
+            code = self._batch_codes(prefs[start:start + chunk])
+            top = top_k_rows(self.batch_ranks[code], top_k)
+            top_scores = self.batch_scores[np.take_along_axis(code, top, axis=1)]
+            for rows, s in zip(top, top_scores):
+                valid = s > -np.inf
+                out.append((rows[valid], s[valid]))
+        return out
+
+    def take(self, rows: np.ndarray, scores: np.ndarray | None = None) -> pd.DataFrame:
+        """
+        Estrae dal DataFrame sorgente le righe indicate, con colonna "score" opzionale.
+        """
+        out = self.frame.iloc[rows].copy()
+        if scores is not None:
+            out["score"] = scores
+        return out
+
+
+# ========================
+# Novità (bandit)
+# ========================
+def novelty_mask(catalog: Catalog,
+                 pref: Dict[str, Any],
+                 rows: np.ndarray | None = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Proxy di novità rispetto ai gusti utente, su tutto il catalogo (o sulle righe indicate).
+
+    Un film è una novità se è fuori dal regista preferito o dalla tolleranza
+    di durata e, quando l'utente ha generi desiderati, non ne condivide nessuno.
+
+    :param catalog: catalogo compilato
+    :param pref: dizionario con le preferenze dell'utente
+    :param rows: indici di riga da valutare (default: tutto il catalogo)
+    :return: array booleano "novel" e array uint8 di codici NOVELTY_* (in OR)
+             con i motivi, da convertire in testo con `novelty_reasons`
+    """
+    if rows is None:
+        rows = slice(None)
+    n = catalog.genre_mask[rows].size
+    codes = np.zeros(n, dtype=np.uint8)
+
+    # Regista fuori preferiti?
+    dir_off = np.zeros(n, dtype=bool)
+    if set(pref.get("favorite_directors") or []):
+        dir_off = ~np.isin(catalog.director[rows], catalog.director_codes(pref["favorite_directors"]))
+        codes[dir_off] |= NOVELTY_DIRECTOR
+
+    # Runtime fuori tolleranza? (NaN mai fuori tolleranza)
+    rt_off = np.zeros(n, dtype=bool)
+    if pref.get("preferred_runtime") is not None:
+        tol = pref.get("tolleranza_runtime", 15)
+        rt_off = np.abs(catalog.runtime[rows].astype(np.float64) - pref["preferred_runtime"]) > tol
+        codes[rt_off] |= NOVELTY_RUNTIME
+
+    novel = dir_off | rt_off
+
+    # Match generi
+    g_des = genre_mask(pref.get("generi_desiderati"))
+    if g_des:
+        genre_off = (catalog.genre_mask[rows] & g_des) == 0
+        codes[genre_off] |= NOVELTY_GENRE
+        novel &= genre_off
+
+    return novel, codes
+
+
+def novelty_reasons(codes) -> list[str]:
+    """
+    Converte i codici di `novelty_mask` nelle stringhe "novelty_reason" delle risposte del bandit.
+    """
+    out = []
+    for c in np.asarray(codes).tolist():
+        reasons = [text for bit, text in NOVELTY_REASONS if c & bit]
+        out.append(", ".join(reasons) if reasons else "in linea con i gusti")
+    return out
@@ -0,0 +1,141 @@
+from pathlib import Path
+from typing import Optional
+
+import hashlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import config
+
+# versione del formato: artefatti scritti con un formato diverso sono obsoleti
+CATALOG_FORMAT = 1
+
+
+def read_movies_csv(path: Path = config.MOVIES_FILE) -> pd.DataFrame:
+    """
+    Legge il CSV dei film con le conversioni di tipo usate dal server
+    (date, durata e premi numerici).
+    """
+    df = pd.read_csv(path)
+    df["release_date"] = pd.to_datetime(df["release_date"], errors="coerce")
+    df["runtime"] = pd.to_numeric(df["runtime"], errors="coerce")
+    df["awards"] = pd.to_numeric(df["awards"], errors="coerce").fillna(0)
+    return df
+
+
+def file_sha1(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pack_strings(values) -> tuple[np.ndarray, np.ndarray]:
+    # stringhe UTF-8 concatenate + offset (come le colonne di testo Arrow)
+    encoded = [v.encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(data: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    buf = data.tobytes()
+    bounds = offsets.tolist()
+    out = np.empty(len(bounds) - 1, dtype=object)
+    out[:] = [buf[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+    return out
+
+
+def save_catalog(frame: pd.DataFrame, path, source: Path = config.MOVIES_FILE):
+    """
+    Salva il catalogo già tipizzato in un .npz colonnare (senza pickle).
+
+    - colonne numeriche e date (datetime64, NaT per le mancanti) così come sono;
+    - colonne di testo come codici categorici int32 (-1 = mancante) più i
+      valori distinti (registi, titoli, URL) in UTF-8 concatenato con offset.
+
+    Insieme alle colonne vengono salvati versione del formato e impronta del
+    CSV sorgente (dimensione, mtime, sha1) per riconoscere un artefatto obsoleto.
+    """
+    st = os.stat(source)
+    arrays = {
+        "format": np.int64(CATALOG_FORMAT),
+        "source_size": np.int64(st.st_size),
+        "source_mtime_ns": np.int64(st.st_mtime_ns),
+        "source_sha1": np.array(file_sha1(source)),
+        "columns": np.array([str(c) for c in frame.columns]),
+    }
+    kinds = []
+    for i, name in enumerate(frame.columns):
+        col = frame[name]
+        if pd.api.types.is_datetime64_any_dtype(col.dtype):
+            kinds.append("date")
+            arrays[f"values_{i}"] = col.to_numpy()
+        elif pd.api.types.is_numeric_dtype(col.dtype):
+            kinds.append("num")
+            arrays[f"values_{i}"] = col.to_numpy()
+        else:
+            codes, uniques = pd.factorize(col)
+            if not all(isinstance(v, str) for v in uniques):
+                raise TypeError(f"colonna {name!r}: tipo non supportato dal catalogo binario")
+            kinds.append("str")
+            arrays[f"codes_{i}"] = codes.astype(np.int32)
+            arrays[f"values_{i}"], arrays[f"offsets_{i}"] = _pack_strings(uniques)
+    arrays["kinds"] = np.array(kinds)
+    np.savez(path, **arrays)
+
+
+def _is_fresh(f, source: Path) -> bool:
+    if int(f["format"]) != CATALOG_FORMAT:
+        return False
+    try:
+        st = os.stat(source)
+    except FileNotFoundError:
+        # solo l'artefatto (es. immagine senza CSV): niente da confrontare
+        return True
+    if st.st_size != int(f["source_size"]):
+        return False
+    # mtime diverso (copia, checkout) ma stesso contenuto: ancora valido
+    return st.st_mtime_ns == int(f["source_mtime_ns"]) or file_sha1(source) == str(f["source_sha1"])
+
+
+def load_catalog(path: Path = config.MOVIES_CATALOG_FILE,
+                 source: Path = config.MOVIES_FILE) -> Optional[pd.DataFrame]:
+    """
+    DataFrame dei film dal catalogo binario, o None se manca o è obsoleto
+    (formato diverso o CSV sorgente cambiato).
+    """
+    if not Path(path).exists():
+        return None
+    with np.load(path) as f:
+        if not _is_fresh(f, source):
+            return None
+        data = {}
+        for i, (name, kind) in enumerate(zip(f["columns"].tolist(), f["kinds"].tolist())):
+            values = f[f"values_{i}"]
+            if kind == "str":
+                codes = f[f"codes_{i}"]
+                col = np.full(codes.size, np.nan, dtype=object)
+                ok = codes >= 0
+                col[ok] = _unpack_strings(values, f[f"offsets_{i}"])[codes[ok]]
+                values = col
+            data[name] = values
+    return pd.DataFrame(data)
+
+
+def load_movies(path: Path = config.MOVIES_CATALOG_FILE,
+                source: Path = config.MOVIES_FILE) -> pd.DataFrame:
+    """
+    Film per il server: catalogo binario se aggiornato, altrimenti il CSV
+    (rigenerare l'artefatto con `precompute.py --catalog`).
+    """
+    t0 = time.perf_counter()
+    frame = load_catalog(path, source)
+    if frame is not None:
+        print(f"Catalogo caricato da {path} ({len(frame)} film, {(time.perf_counter() - t0) * 1000:.1f} ms)")
+        return frame
+    print(f"{path} mancante o non aggiornato: lettura di {source}")
+    return read_movies_csv(source)
@@ -0,0 +1,53 @@
+import sys
+
+from cache import prefs_key
+from catalog import Catalog
+from catalog_store import load_movies
+from materialize import build_table
+from prefs import normalize_prefs
+
+
+def main():
+    """
+    Verifica che `prefs_key` regga i payload salvati dagli utenti:
+    - campi extra qualsiasi (anche liste di dict, non hashabili) non fanno fallire l'hash;
+    - campi extra non usati dallo scoring (es. liked_movie) non cambiano la chiave;
+    - ordine e duplicati delle liste note non cambiano la chiave;
+    - un campo di scoring diverso cambia la chiave;
+    - `build_table` (materialize.py) non fallisce per un utente con campi extra
+      e gli assegna la stessa lista di un profilo equivalente senza extra.
+    """
+    base = normalize_prefs({"generi_desiderati": ["Action", "Comedy"]})
+    checks = {
+        "extra con lista di dict": normalize_prefs({"generi_desiderati": ["Action", "Comedy"], "tags": [{"a": 1}]}),
+        "extra liked_movie": normalize_prefs({"generi_desiderati": ["Action", "Comedy"], "liked_movie": "Heat (1995)"}),
+        "ordine e duplicati": normalize_prefs({"generi_desiderati": ["Comedy", "Action", "Comedy"]}),
+    }
+    failures = []
+    for name, pref in checks.items():
+        try:
+            same = prefs_key(pref) == prefs_key(base)
+        except Exception as e:
+            failures.append(f"{name}: {type(e).__name__}: {e}")
+            continue
+        if not same:
+            failures.append(f"{name}: chiave diversa")
+    if prefs_key(normalize_prefs({"generi_desiderati": ["Action"]})) == prefs_key(base):
+        failures.append("generi diversi: stessa chiave")
+
+    try:
+        table, _ = build_table(Catalog(load_movies()), {"base": base, **checks}, top_n=20)
+        rows = [table.lookup(uid, prefs_key(p)) for uid, p in {"base": base, **checks}.items()]
+        if any(r is None or not (r[0] == rows[0][0]).all() for r in rows):
+            failures.append("build_table: liste diverse per profili equivalenti")
+    except Exception as e:
+        failures.append(f"build_table: {type(e).__name__}: {e}")
+
+    for f in failures:
+        print(f)
+    print("OK" if not failures else "ERRORI")
+    sys.exit(0 if not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import sys
+
+import numpy as np
+
+import config
+from precompute import item_embeddings
+from similarity import NeighborIndex, normalize_rows
+
+# Tolleranza documentata per tipo dei punteggi salvati (errore assoluto su correlazioni in [-1, 1]):
+# float16 ha ~3 cifre decimali (mezzo ulp vicino a 1 = 4.9e-4), float32 ~7.
+TOLERANCE = {"float16": 1e-3, "float32": 1e-6, "float64": 1e-12}
+
+
+def main():
+    """
+    Confronta i vicini serviti da /similar_movies con le correlazioni esatte in float64
+    calcolate dai vettori latenti del modello salvato (svd_model.npz).
+
+    Per ogni film e posizione p controlla:
+    - errore sui punteggi: |punteggio salvato - correlazione esatta| del vicino servito;
+    - errore di ranking: |p-esima correlazione esatta - correlazione esatta del p-esimo servito|,
+      cioè quanto il film servito in posizione p è peggiore di quello che ci dovrebbe essere.
+    Entrambi devono restare entro TOLERANCE[dtype dei punteggi].
+    """
+    index = NeighborIndex.load(config.MOVIES_NEIGHBORS_FILE, config.MOVIES_NEIGHBOR_SCORES_FILE)
+    movie_ids, embeddings = item_embeddings()
+    if not np.array_equal(movie_ids, np.load(config.MOVIES_IDS_FILE)):
+        sys.exit("movies_ids.npy non corrisponde al modello salvato: rieseguire precompute.py")
+
+    dtype = index.scores.dtype.name
+    tol = TOLERANCE[dtype]
+    z = normalize_rows(embeddings)
+    n, k = index.neighbors.shape
+
+    score_err = rank_err = 0.0
+    nan_rows = 0
+    for start in range(0, n, config.CORR_BLOCK_ROWS):
+        stop = min(start + config.CORR_BLOCK_ROWS, n)
+        block = z[start:stop] @ z.T
+        rows = np.arange(stop - start)
+        block[rows, rows + start] = -np.inf
+
+        served = np.asarray(index.neighbors[start:stop])
+        scores = np.asarray(index.scores[start:stop], dtype=np.float64)
+        nan_rows += int(np.isnan(scores).any(axis=1).sum())
+
+        exact_served = np.take_along_axis(block, served, axis=1)
+        exact_best = -np.sort(-np.partition(block, n - k, axis=1)[:, n - k:], axis=1)
+
+        score_err = max(score_err, float(np.abs(scores - exact_served).max(initial=0.0)))
+        rank_err = max(rank_err, float(np.abs(exact_best - exact_served).max(initial=0.0)))
+
+    print(f"film: {n}, vicini per film: {k}, punteggi: {dtype} (tolleranza {tol:g})")
+    print(f"righe con NaN: {nan_rows}")
+    print(f"errore massimo punteggi: {score_err:.3g}")
+    print(f"errore massimo ranking:  {rank_err:.3g}")
+
+    ok = nan_rows == 0 and score_err <= tol and rank_err <= tol
+    print("OK" if ok else "FUORI TOLLERANZA")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,9 +11,99 @@ AWARD_WEIGHT = 0.3
 DIRECTOR_WEIGHT = 1.0
 RUNTIME_WEIGHT = 0.2
 
+# ====== Raccomandazioni ibride ======
+# /recommendations_hybrid: score = HYBRID_CONTENT_WEIGHT * punteggio constraint-based
+# (1 per genere desiderato + bonus) + HYBRID_CF_WEIGHT * correlazione con liked_movie (-1..1)
+HYBRID_CONTENT_WEIGHT = 1.0
+HYBRID_CF_WEIGHT = 2.0
+
+# ====== Batch ======
+# celle (utenti x film) massime per blocco nello scoring batch
+BATCH_MAX_CELLS = 2_000_000
+
+# ====== Cache raccomandazioni ======
+# profili (preferenze normalizzate) tenuti in cache, scadenza in secondi
+RECS_CACHE_SIZE = 10_000
+RECS_CACHE_TTL = 600
+# lunghezza minima delle liste in cache: i top_k più piccoli sono una fetta
+RECS_CACHE_MIN_K = 50
+
+# ====== Raccomandazioni materializzate ======
+# materialize.py: film salvati per utente (top_k più grandi sono calcolati al momento)
+RECS_TABLE_TOP_N = 100
+# secondi di attesa prima di salvare le righe aggiornate dal server (più modifiche -> una scrittura)
+RECS_TABLE_WRITE_DELAY = 5.0
+
+# ====== Modello SVD ======
+SVD_COMPONENTS = 30
+# precompute.py --update riaddestra da zero quando i film proiettati dall'ultimo
+# addestramento (o i rating di utenti nuovi) superano questa frazione
+SVD_RETRAIN_FRACTION = 0.1
+
+# ====== Valutazione offline ======
+# offline_eval.py: lunghezza delle liste, ultimi rating di ogni utente nel test
+# (leave-last-N-out), frazione più recente dei rating nel test (taglio temporale
+# globale) e voto minimo perché un film del test sia rilevante (0 = tutti)
+OFFLINE_TOP_K = 10
+OFFLINE_LAST_N = 5
+OFFLINE_TEST_FRACTION = 0.2
+OFFLINE_MIN_RATING = 0.0
+
+# ====== Collaborative filtering user-user ======
+# user_cf.py: vicini per utente, candidati salvati per utente e vicini minimi
+# che devono aver votato un film perché sia candidato
+USER_CF_NEIGHBORS = 50
+USER_CF_TOP_N = 100
+USER_CF_MIN_SUPPORT = 2
+# utenti per blocco (memoria ~ righe * (utenti + film) * 8 byte) e processi (0 = tutti i core)
+USER_CF_CHUNK_ROWS = 256
+USER_CF_WORKERS = 0
+
+# ====== Film simili ======
+# vicini salvati per film (massimo top_k servibile da /similar_movies)
+NEIGHBORS_K = 50
+# righe per blocco nel calcolo delle correlazioni (memoria ~ righe * film * 8 byte)
+CORR_BLOCK_ROWS = 1024
+# tipo dei punteggi salvati: "float32" o "float16" (metà spazio, errore <= 1e-3, vedi check_similarity.py)
+NEIGHBOR_SCORES_DTYPE = "float32"
+# sorgente di /similar_movies: "neighbors" (liste esatte precalcolate, top_k <= NEIGHBORS_K)
+# o "ann" (indice approssimato sugli embedding, qualsiasi top_k)
+SIMILAR_BACKEND = "neighbors"
+# indice approssimato: tabelle hash e bit per codice (bucket medi da film / 2**bit,
+# indicativamente bit ~ log2(film) - 1; 12-14 per cataloghi da 10^5-10^6 film)
+ANN_TABLES = 16
+ANN_BITS = 10
+# bucket visitati per tabella: più probe = recall più alto, query più lente (vedi experiments/bench_ann.py)
+ANN_PROBES = 6
+
+# ====== Server ======
+# serve.py: il processo padre carica catalogo e artefatti una volta e avvia
+# SERVER_WORKERS worker con fork (pagine condivise copy-on-write).
+# Con più di un worker serve USERS_BACKEND = "sqlite": users.json in memoria
+# è per processo e i salvataggi di un worker sovrascriverebbero gli altri.
+SERVER_HOST = "0.0.0.0"
+SERVER_PORT = 8058
+SERVER_WORKERS = 1
+
 # ====== Path file ======
 MOVIES_FILE = DATA_DIR / "movies_enriched.csv"
 RATINGS_FILE = DATA_DIR / "ratings.csv"
-MOVIES_CORR_FILE = DATA_DIR / "movies_corr.npy"
+MOVIES_NEIGHBORS_FILE = DATA_DIR / "movies_neighbors.npy"
+MOVIES_NEIGHBOR_SCORES_FILE = DATA_DIR / "movies_neighbor_scores.npy"
+# catalogo tipizzato in formato colonnare, generato da precompute.py
+MOVIES_CATALOG_FILE = DATA_DIR / "movies_catalog.npz"
 MOVIES_LIST_FILE = DATA_DIR / "movies_list.json"
+MOVIES_IDS_FILE = DATA_DIR / "movies_ids.npy"
+SVD_MODEL_FILE = DATA_DIR / "svd_model.npz"
+MOVIES_EMBEDDINGS_FILE = DATA_DIR / "movies_embeddings.npy"
+MOVIES_ANN_FILE = DATA_DIR / "movies_ann.npz"
+USER_CF_FILE = DATA_DIR / "user_cf_candidates.npz"
+RECS_TABLE_FILE = DATA_DIR / "recommendations_table.npz"
 USERS_FILE = DATA_DIR / "users.json"
+
+# ====== Utenti ======
+# backend del repository utenti: "json" (USERS_FILE) o "sqlite" (USERS_DB_FILE)
+USERS_BACKEND = "json"
+USERS_DB_FILE = DATA_DIR / "users.db"
+# secondi di attesa prima di salvare users.json (più modifiche -> una scrittura)
+USERS_WRITE_DELAY = 0.5
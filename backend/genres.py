@@ -0,0 +1,74 @@
+from typing import Iterable, Mapping, Any
+
+import numpy as np
+
+# Colonne 0/1 dei generi MovieLens (stesso ordine di movies_enriched.csv)
+GENRES = [
+    "unknown", "Action", "Adventure", "Animation", "Children", "Comedy", "Crime",
+    "Documentary", "Drama", "Fantasy", "Film_noir", "Horror", "Musical", "Mystery",
+    "Romance", "Sci_fi", "Thriller", "War", "Western"
+]
+
+# Ogni genere occupa un bit di un uint32: bit i <-> GENRES[i]
+GENRE_BIT = {g: 1 << i for i, g in enumerate(GENRES)}
+GENRE_BITS = np.array([GENRE_BIT[g] for g in GENRES], dtype=np.uint32)
+
+# "unknown" non è un vero genere: escluso da ILD, serendipità e rilevanza proxy
+KNOWN_GENRES_MASK = np.uint32(((1 << len(GENRES)) - 1) ^ GENRE_BIT["unknown"])
+
+
+def genre_mask(names: Iterable[str] | None) -> np.uint32:
+    """
+    Compila una lista di nomi di genere in una bitmask (i nomi sconosciuti sono ignorati).
+    """
+    m = 0
+    for g in names or []:
+        m |= GENRE_BIT.get(g, 0)
+    return np.uint32(m)
+
+
+def pack_genres(flags: np.ndarray, names: list[str] = GENRES) -> np.ndarray:
+    """
+    Impacchetta una matrice film x generi di flag 0/1 in un array di bitmask uint32.
+
+    :param flags: matrice (n, len(names)) con i flag dei generi
+    :param names: nome del genere di ciascuna colonna di flags
+    :return: array (n,) di bitmask uint32
+    """
+    bits = np.array([GENRE_BIT[g] for g in names], dtype=np.uint32)
+    return (np.asarray(flags) != 0).astype(np.uint32) @ bits
+
+
+def record_mask(rec: Mapping[str, Any]) -> np.uint32:
+    """
+    Bitmask dei generi di un film serializzato (dict con i flag dei generi a 0/1).
+    """
+    m = 0
+    for g, bit in GENRE_BIT.items():
+        v = rec.get(g)
+        if v == 1 or v is True or v == "1":
+            m |= bit
+    return np.uint32(m)
+
+
+def popcount(masks) -> np.ndarray:
+    """
+    Numero di generi (bit a 1) di ciascuna bitmask.
+    """
+    return np.bitwise_count(np.asarray(masks, dtype=np.uint32))
+
+
+def mean_pairwise_jaccard(masks) -> float:
+    """
+    Similarità di Jaccard media su tutte le coppie di bitmask (i < j).
+
+    :param masks: array di bitmask uint32
+    :return: media delle similarità, 0.0 se ci sono meno di due elementi
+    """
+    m = np.asarray(masks, dtype=np.uint32)
+    if m.size < 2:
+        return 0.0
+    i, j = np.triu_indices(m.size, k=1)
+    inter = popcount(m[i] & m[j])
+    union = popcount(m[i] | m[j])
+    return float(np.mean(inter / np.maximum(union, 1)))
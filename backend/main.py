@@ -1,18 +1,29 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Optional, Tuple, NamedTuple
+import time
 
 import pandas as pd
 import numpy as np
-import json
 import config
-import random
+from catalog import Catalog, novelty_mask, novelty_reasons
+from catalog_store import load_movies
+from user_store import open_user_store
+from similarity import NeighborIndex
+from ann import RandomProjectionIndex
+from user_cf import UserCandidates
+from serialization import RecordSerializer, parse_fields
+from cache import LRUCache, prefs_key
+from materialize import RecommendationTable, build_table
+from prefs import normalize_prefs
 
 # ========================
 # Init app
 # ========================
-app = FastAPI(title="Movie Recommendation API")
+# risposte serializzate con orjson invece dell'encoder JSON di default
+app = FastAPI(title="Movie Recommendation API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -28,269 +39,241 @@ app.add_middleware(
 # ========================
 # Caricamento dataset film
 # ========================
-df = pd.read_csv(config.MOVIES_FILE)
-df["release_date"] = pd.to_datetime(df["release_date"], errors="coerce")
-df["runtime"] = pd.to_numeric(df["runtime"], errors="coerce")
-df["awards"] = pd.to_numeric(df["awards"], errors="coerce").fillna(0)
+# catalogo binario già tipizzato (precompute.py), CSV solo se manca o è obsoleto
+df = load_movies()
+
+# Compila il catalogo in array NumPy una sola volta all'avvio
+CATALOG = Catalog(df)
+# Campi JSON statici di ogni film (date formattate, NaN -> None), pronti per le risposte
+RECORDS = RecordSerializer(df)
+
+# Carica film dell'indice (movie_id per riga) e vicini precalcolati (top-k per film)
+MOVIES_IDS = np.load(config.MOVIES_IDS_FILE)
+# movie_id -> riga dell'indice dei vicini (-1 = film senza vicini)
+NEIGHBOR_ROW_OF_ID = np.full(
+    max(int(MOVIES_IDS.max(initial=0)), int(CATALOG.movie_id.max(initial=0))) + 1, -1, dtype=np.int32
+)
+NEIGHBOR_ROW_OF_ID[MOVIES_IDS] = np.arange(MOVIES_IDS.size, dtype=np.int32)
 
-# Carica lista film e matrice correlazioni
-with open(config.MOVIES_LIST_FILE, "r", encoding="utf-8") as f:
-    MOVIES_LIST = json.load(f)
+# mappati in sola lettura (mmap): avvio immediato e pagine condivise tra i worker
+EMBEDDINGS = np.load(config.MOVIES_EMBEDDINGS_FILE, mmap_mode="r")
+if config.SIMILAR_BACKEND == "ann":
+    NEIGHBORS = RandomProjectionIndex.load(config.MOVIES_ANN_FILE, EMBEDDINGS, probes=config.ANN_PROBES)
+else:
+    NEIGHBORS = NeighborIndex.load(config.MOVIES_NEIGHBORS_FILE, config.MOVIES_NEIGHBOR_SCORES_FILE)
 
-MOVIES_CORR = np.load(config.MOVIES_CORR_FILE)
-# pulizia NaN nella matrice di correlazione per evitare problemi in runtime
-MOVIES_CORR = np.nan_to_num(MOVIES_CORR, nan=0.0)
+# candidati user-user precalcolati da user_cf.py (None finché il job non è stato eseguito)
+USER_CF = UserCandidates.load(config.USER_CF_FILE) if config.USER_CF_FILE.exists() else None
 
-# ========================
-# Utils (inline, no utils.py)
-# ========================
-def load_users() -> Dict[str, Any]:
+# embedding normalizzati per riga del catalogo (film senza embedding = vettore nullo), per /recommendations_hybrid
+CATALOG_EMBEDDINGS = np.zeros((CATALOG.size, EMBEDDINGS.shape[1]), dtype=np.float32)
+_embedding_rows = NEIGHBOR_ROW_OF_ID[CATALOG.movie_id]
+CATALOG_EMBEDDINGS[_embedding_rows >= 0] = EMBEDDINGS[_embedding_rows[_embedding_rows >= 0]]
+
+# Repository utenti (config.USERS_BACKEND): users.json in memoria o SQLite
+USERS = open_user_store(normalize=normalize_prefs)
+
+# Cache dei top-k constraint-based: (hash preferenze, versione catalogo) -> (righe, score, k calcolato)
+RECS_CACHE = LRUCache(maxsize=config.RECS_CACHE_SIZE, ttl=config.RECS_CACHE_TTL)
+
+def cached_recommend(pref: Dict[str, Any], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    `CATALOG.recommend` con cache: profili identici condividono il risultato.
+
+    Si calcola almeno RECS_CACHE_MIN_K film (stesso costo di un top-5 con
+    argpartition) e un top_k più piccolo è una fetta della lista in cache;
+    una lista più corta del top_k chiesto serve solo se contiene già tutto il catalogo utile.
     """
-    Carica il dizionario degli utenti dal file JSON config.USERS_FILE.
+    top_k = max(top_k, 0)
+    key = (prefs_key(pref), CATALOG.version)
+    hit = RECS_CACHE.get(key, valid=lambda v: v[2] >= top_k or v[0].size < v[2])
+    if hit is None:
+        k = max(top_k, config.RECS_CACHE_MIN_K)
+        rows, scores = CATALOG.recommend(pref, top_k=k)
+        rows.flags.writeable = scores.flags.writeable = False
+        hit = (rows, scores, k)
+        RECS_CACHE.put(key, hit)
+    rows, scores, _ = hit
+    return rows[:top_k], scores[:top_k]
+
+def load_recommendation_table() -> Optional[RecommendationTable]:
     """
-    if config.USERS_FILE.exists():
-        with open(config.USERS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    return {}
+    Top-N materializzati per utente (materialize.py), None se il file manca.
 
-def save_users(users: Dict[str, Any]):
+    Se la tabella è stata calcolata su un altro catalogo viene ricalcolata qui
+    (scoring batch di tutti gli utenti) e salvata al posto della vecchia.
     """
-    Salva il dizionario utenti su config.USERS_FILE.
+    if not config.RECS_TABLE_FILE.exists():
+        return None
+    table = RecommendationTable.load(config.RECS_TABLE_FILE, persist=True)
+    if table.catalog_version != CATALOG.version:
+        t0 = time.perf_counter()
+        rebuilt, _ = build_table(CATALOG, USERS.all(), previous=table)
+        rebuilt.save(config.RECS_TABLE_FILE)
+        table = RecommendationTable.load(config.RECS_TABLE_FILE, persist=True)
+        print(f"{config.RECS_TABLE_FILE} calcolata su un altro catalogo: ricalcolati "
+              f"{len(table.user_ids)} utenti ({time.perf_counter() - t0:.2f} s)")
+    return table
+
+RECS_TABLE = load_recommendation_table()
+
+def user_recommend(user_id: str, pref: Dict[str, Any], top_k: int) -> Tuple[np.ndarray, np.ndarray]:
     """
-    with open(config.USERS_FILE, "w", encoding="utf-8") as f:
-        json.dump(users, f, indent=2, ensure_ascii=False)
+    Top-k di un utente dalla tabella materializzata (lookup O(1)) se la sua riga è
+    aggiornata, altrimenti `cached_recommend`.
 
-def clean_results(df_in: pd.DataFrame) -> list[dict]:
+    Dalla tabella arrivano solo i movie_id: i punteggi delle k righe restituite
+    sono ricalcolati in float64, identici a quelli del calcolo completo.
     """
-    Converte un DataFrame in lista di dict serializzabile JSON.
+    movie_ids = RECS_TABLE.get(user_id, prefs_key(pref), top_k) if RECS_TABLE is not None else None
+    if movie_ids is None:
+        return cached_recommend(pref, top_k)
+    rows = CATALOG.rows_for_ids(movie_ids)
+    return rows, CATALOG.score_rows(pref, rows)
+
+def refresh_user_recommendations(user_id: str, pref: Dict[str, Any]):
     """
-    df2 = df_in.copy()
-    df2 = df2.replace({np.nan: None})
-    for col in df2.select_dtypes(include=["datetime64[ns]"]).columns:
-        df2[col] = df2[col].dt.strftime("%Y-%m-%d")
-    return df2.to_dict(orient="records")
-
-# ---- Preferenze: default e normalizzazione ----
-DEFAULT_PREFS: Dict[str, Any] = {
-    "min_release_year": 0,
-    "generi_desiderati": [],
-    "generi_vietati": [],
-    "prefer_award_winning": False,
-    "preferred_runtime": None,
-    "tolleranza_runtime": 0,
-    "favorite_directors": [],
-}
-
-def normalize_prefs(p: Optional[Dict[str, Any]]) -> Dict[str, Any]:
-    p = dict(p or {})
-    out = {**DEFAULT_PREFS, **p}
-
-    # numeri
-    try:
-        out["min_release_year"] = int(out.get("min_release_year", 0) or 0)
-    except Exception:
-        out["min_release_year"] = 0
+    Ricalcola la riga materializzata di un utente creato o modificato
+    (salvata su RECS_TABLE_FILE dopo RECS_TABLE_WRITE_DELAY secondi).
+    """
+    if RECS_TABLE is not None:
+        rows, scores = cached_recommend(pref, RECS_TABLE.top_n)
+        RECS_TABLE.update(user_id, prefs_key(pref), CATALOG.movie_id[rows], scores)
 
-    try:
-        pr = out.get("preferred_runtime", None)
-        out["preferred_runtime"] = None if pr in (None, "", "null") else int(pr)
-    except Exception:
-        out["preferred_runtime"] = None
+def invalidate_recommendations(*prefs: Optional[Dict[str, Any]]):
+    """
+    Scarta dalla cache i risultati dei profili indicati (vecchie e nuove preferenze di un utente).
+    """
+    for p in prefs:
+        if p is not None:
+            RECS_CACHE.invalidate((prefs_key(p), CATALOG.version))
 
+def request_fields(fields: str | None) -> tuple[str, ...] | None:
+    """
+    Proiezione `fields=` di una richiesta, validata sui campi statici dei film:
+    un nome sconosciuto è un errore 400 con l'elenco dei campi ammessi.
+    """
     try:
-        out["tolleranza_runtime"] = int(out.get("tolleranza_runtime", 0) or 0)
-    except Exception:
-        out["tolleranza_runtime"] = 0
-
-    # liste
-    for k in ("generi_desiderati", "generi_vietati", "favorite_directors"):
-        v = out.get(k, [])
-        if isinstance(v, (list, tuple)):
-            out[k] = [str(x) for x in v]
-        else:
-            out[k] = []
-
-    # booleano
-    out["prefer_award_winning"] = bool(out.get("prefer_award_winning", False))
-    return out
+        return parse_fields(fields, allowed=RECORDS.fields)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=400,
+            detail=f"campi sconosciuti in fields: {e}. Ammessi: {', '.join(RECORDS.fields)} "
+                   "(i campi calcolati, come score, sono sempre inclusi)",
+        )
 
 # ---- Bandit helpers ----
-def is_novelty(row: pd.Series, pref: Dict[str, Any]) -> Tuple[bool, str]:
-    """
-    Semplice proxy di novità rispetto ai gusti utente.
-    """
-    reasons = []
-    g_des = [g for g in (pref.get("generi_desiderati") or []) if g in row.index]
-    fav_dirs = set(pref.get("favorite_directors") or [])
-
-    # Match generi
-    has_genre_match = False
-    if g_des:
-        has_genre_match = (int(row[g_des].sum()) > 0)
-
-    # Regista fuori preferiti?
-    dir_off = (len(fav_dirs) > 0 and row.get("director") not in fav_dirs)
-
-    # Runtime fuori tolleranza?
-    rt_off = False
-    if pref.get("preferred_runtime") is not None and "runtime" in row.index and pd.notna(row["runtime"]):
-        tol = pref.get("tolleranza_runtime", 15)
-        rt_off = abs(row["runtime"] - pref["preferred_runtime"]) > tol
-
-    if g_des:
-        is_novel = (not has_genre_match) and (dir_off or rt_off)
-        if not has_genre_match:
-            reasons.append("genere fuori profilo")
-    else:
-        is_novel = (dir_off or rt_off)
-
-    if dir_off:
-        reasons.append("regista fuori preferiti")
-    if rt_off:
-        reasons.append("runtime fuori tolleranza")
-
-    return is_novel, (", ".join(reasons) if reasons else "in linea con i gusti")
+def _catalog_for(df_all: pd.DataFrame) -> Catalog:
+    # il catalogo globale è già compilato; altri DataFrame vengono compilati al volo
+    return CATALOG if df_all is CATALOG.frame else Catalog(df_all)
 
 def _constraint_pool(df_all: pd.DataFrame, pref: Dict[str, Any], k: int) -> pd.DataFrame:
-    return recommend_movies(df_all, pref, top_k=k).copy()
+    return recommend_movies(df_all, pref, top_k=k)
 
 def _year_filtered(df_all: pd.DataFrame, pref: Dict[str, Any]) -> pd.DataFrame:
-    df_y = df_all[df_all["release_date"].dt.year >= pref.get("min_release_year", 0)].copy()
-    return df_y
+    cat = _catalog_for(df_all)
+    return cat.take(cat.year_rows(pref))
+
+class BanditPools(NamedTuple):
+    """
+    Pool disgiunti del bandit come indici di riga del catalogo.
+    """
+    catalog: Catalog
+    exploit_rows: np.ndarray     # ordinati per score decrescente
+    exploit_scores: np.ndarray
+    explore_rows: np.ndarray
+    novel: np.ndarray            # flag di novità per tutto il catalogo
+    novelty_codes: np.ndarray    # codici NOVELTY_* per tutto il catalogo
+
+    @property
+    def empty(self) -> bool:
+        return self.exploit_rows.size == 0 and self.explore_rows.size == 0
 
 def build_pools(df_all: pd.DataFrame,
                 pref: Dict[str, Any],
                 candidate_pool: int = 100,
-                explore_extra: int = 200) -> tuple[pd.DataFrame, pd.DataFrame]:
-    exploit_pool = _constraint_pool(df_all, pref, k=max(candidate_pool, 20))
-    if exploit_pool.empty:
-        return exploit_pool, exploit_pool  # entrambi vuoti
-
-    ex = exploit_pool.copy()
-
-    base_wide = _year_filtered(df_all, pref)
-    base_wide = base_wide[~base_wide["movie_id"].isin(ex["movie_id"])].copy()
-
-    if not base_wide.empty:
-        nov_flags, nov_reasons = zip(*[is_novelty(r, pref) for _, r in base_wide.iterrows()])
-        base_wide["novel"] = list(nov_flags)
-        base_wide["novelty_reason"] = list(nov_reasons)
-
-    explore_pool = base_wide[base_wide["novel"]].copy() if not base_wide.empty else base_wide
-
+                explore_extra: int = 200,
+                rng: np.random.Generator | None = None) -> BanditPools:
+    cat = _catalog_for(df_all)
+    rng = rng if rng is not None else np.random.default_rng()
+    ex_rows, ex_scores = cat.recommend(pref, top_k=max(candidate_pool, 20))
+
+    # novità calcolata in un solo passaggio su tutto il catalogo
+    novel, codes = novelty_mask(cat, pref)
+    if ex_rows.size == 0:
+        return BanditPools(cat, ex_rows, ex_scores, ex_rows, novel, codes)  # entrambi vuoti
+
+    wide = cat.year_mask(pref)
+    wide[ex_rows] = False
+    explore_rows = np.flatnonzero(wide & novel)
+
+    # fallback se explore è troppo piccolo: completa con film a caso della stessa epoca
+    # (la coda dell'exploit non può entrare in explore, che resta disgiunto)
     MIN_EXPLORE = min(50, explore_extra)
-    if explore_pool.shape[0] < MIN_EXPLORE:
-        tail = ex.sort_values("score", ascending=True).head(MIN_EXPLORE)
-        tail = tail[~tail["movie_id"].isin(explore_pool["movie_id"] if not explore_pool.empty else [])]
-        explore_pool = pd.concat([explore_pool, tail], ignore_index=True) if not explore_pool.empty else tail.copy()
-
-        if not base_wide.empty:
-            need = MIN_EXPLORE - explore_pool.shape[0]
-            if need > 0:
-                explore_pool = pd.concat(
-                    [explore_pool, base_wide.sample(n=min(need, base_wide.shape[0]), random_state=None)],
-                    ignore_index=True
-                )
-
-    explore_pool = explore_pool[~explore_pool["movie_id"].isin(ex["movie_id"])]
-    return ex.reset_index(drop=True), explore_pool.reset_index(drop=True)
-
-def epsilon_greedy_from_pools(exploit_pool: pd.DataFrame,
-                              explore_pool: pd.DataFrame,
-                              pref: Dict[str, Any],
-                              top_k: int = 5,
-                              epsilon: float = 0.2,
-                              seed: int | None = None) -> pd.DataFrame:
-    if seed is not None:
-        random.seed(seed)
-        np.random.seed(seed)
-
-    if exploit_pool.empty and explore_pool.empty:
-        return exploit_pool.head(0)
-
-    ex = exploit_pool.sort_values("score", ascending=False).copy()
-    ex_ids = set()
-    rows = []
-
-    def _ensure_novelty(df_in: pd.DataFrame) -> pd.DataFrame:
-        if "novel" in df_in.columns and "novelty_reason" in df_in.columns:
-            return df_in
-        flags, reasons = zip(*[is_novelty(r, pref) for _, r in df_in.iterrows()]) if not df_in.empty else ([], [])
-        out = df_in.copy()
-        if not df_in.empty:
-            out["novel"] = list(flags)
-            out["novelty_reason"] = list(reasons)
-        return out
-
-    ex = _ensure_novelty(ex)
-    xp = _ensure_novelty(explore_pool)
-
-    ex_idx = 0
-    for _ in range(top_k):
-        pick_explore = (random.random() < epsilon) and not xp.empty
-        chosen = None
-        strategy = "explore" if pick_explore else "exploit"
+    need = MIN_EXPLORE - explore_rows.size - min(MIN_EXPLORE, ex_rows.size)
+    if need > 0:
+        base_rows = np.flatnonzero(wide)
+        sampled = rng.choice(base_rows, size=min(need, base_rows.size), replace=False)
+        explore_rows = np.concatenate([explore_rows, sampled])
+
+    return BanditPools(cat, ex_rows, ex_scores, explore_rows, novel, codes)
+
+def epsilon_greedy_picks(pools: BanditPools,
+                         top_k: int = 5,
+                         epsilon: float = 0.2,
+                         rng: np.random.Generator | None = None) -> Tuple[np.ndarray, np.ndarray, list[str]]:
+    """
+    ε-greedy sui due pool, solo su indici.
 
-        if pick_explore:
-            xp_available = xp[~xp["movie_id"].isin(ex_ids)]
-            if not xp_available.empty:
-                chosen = xp_available.sample(n=1, random_state=None).iloc[0]
-            else:
-                pick_explore = False
+    :return: (righe scelte, score (NaN per explore), strategia di ogni scelta)
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    cat = pools.catalog
+    if pools.empty:
+        return np.empty(0, dtype=np.intp), np.empty(0), []
+
+    ex_rows, xp_rows = pools.exploit_rows, pools.explore_rows
+    # explore: permutazione pre-mescolata letta con un cursore
+    xp_order = xp_rows[rng.permutation(xp_rows.size)]
+    visited = np.zeros(cat.size, dtype=bool)
+    draws = rng.random(top_k) if top_k > 0 else []
+
+    picks, scores, strategies = [], [], []
+    ex_idx = xp_idx = 0
+    for u in draws:
+        chosen = None
+        if u < epsilon:
+            while xp_idx < xp_order.size and visited[xp_order[xp_idx]]:
+                xp_idx += 1
+            if xp_idx < xp_order.size:
+                chosen, score, strategy = xp_order[xp_idx], np.nan, "explore"
+                xp_idx += 1
 
-        if not pick_explore:
-            while ex_idx < len(ex) and ex.iloc[ex_idx]["movie_id"] in ex_ids:
+        if chosen is None:
+            while ex_idx < ex_rows.size and visited[ex_rows[ex_idx]]:
                 ex_idx += 1
-            if ex_idx < len(ex):
-                chosen = ex.iloc[ex_idx]
+            if ex_idx < ex_rows.size:
+                chosen, score, strategy = ex_rows[ex_idx], pools.exploit_scores[ex_idx], "exploit"
                 ex_idx += 1
 
         if chosen is None:
             break
 
-        ex_ids.add(int(chosen["movie_id"]))
-        row = chosen.copy()
-        row["pick_strategy"] = strategy
-        rows.append(row)
+        visited[chosen] = True
+        picks.append(chosen)
+        scores.append(score)
+        strategies.append(strategy)
 
-    return pd.DataFrame(rows)
+    return np.asarray(picks, dtype=np.intp), np.asarray(scores, dtype=np.float64), strategies
 
 # ---- Recommender base (constraint/content-based) ----
 def recommend_movies(df, pref, top_k=5):
-    df_f = df[df["release_date"].dt.year >= pref.get("min_release_year", 0)].copy()
-
-    # rimuovi film con generi vietati
-    if pref.get("generi_vietati"):
-        cols_vietati = [g for g in pref["generi_vietati"] if g in df_f.columns]
-        if cols_vietati:
-            penalita_genere = df_f[cols_vietati].sum(axis=1)
-            df_f = df_f[penalita_genere == 0]
-
-    # punteggio base sui generi desiderati
-    score = 0
-    if pref.get("generi_desiderati"):
-        cols_desid = [g for g in pref["generi_desiderati"] if g in df_f.columns]
-        if cols_desid:
-            score = df_f[cols_desid].sum(axis=1)
-
-    # bonus premi
-    if pref.get("prefer_award_winning", False) and "awards" in df_f.columns:
-        score = score + df_f["awards"] * config.AWARD_WEIGHT
-
-    # bonus registi
-    if pref.get("favorite_directors"):
-        liked_dir = df_f["director"].isin(pref["favorite_directors"]).astype(int)
-        score = score + liked_dir * config.DIRECTOR_WEIGHT
-
-    # bonus durata
-    if pref.get("preferred_runtime") is not None and "runtime" in df_f.columns:
-        delta = (df_f["runtime"] - pref["preferred_runtime"]).abs()
-        near = (delta <= pref.get("tolleranza_runtime", 15)).astype(int)
-        score = score + near * config.RUNTIME_WEIGHT
-
-    df_f["score"] = score
-    recs = df_f.sort_values(by="score", ascending=False).head(top_k)
-    return recs
+    """
+    Top-k film per le preferenze utente, calcolati sul catalogo compilato.
+    """
+    cat = _catalog_for(df)
+    rows, scores = cat.recommend(pref, top_k=top_k)
+    return cat.take(rows, scores)
 
 # ========================
 # Schemi request
@@ -299,86 +282,200 @@ class CreateUserRequest(BaseModel):
     user_id: str
     preferences: Optional[Dict[str, Any]] = None
 
+class BatchRecommendationRequest(BaseModel):
+    user_ids: list[str] = []
+    # profili inline: etichetta -> preferenze (non salvati in users.json)
+    preferences: Dict[str, Dict[str, Any]] = {}
+    top_k: int = 5
+
 # ========================
 # Endpoints
 # ========================
 @app.get("/similar_movies/{movie_title}")
-def get_similar_movies(movie_title: str, top_k: int = 5):
-    if movie_title not in MOVIES_LIST:
+def get_similar_movies(movie_title: str, top_k: int = 5, fields: str | None = None):
+    selected = request_fields(fields)
+    # titolo normalizzato -> film a catalogo (duplicati in ordine di movie_id) -> riga dei vicini
+    ids = CATALOG.movie_id[CATALOG.titles.lookup(movie_title)]
+    rows = NEIGHBOR_ROW_OF_ID[ids]
+    rows = rows[rows >= 0]
+    if rows.size == 0:
         return {
             "status": "no_match",
             "message": f"Movie '{movie_title}' not found in index.",
             "results": []
         }
 
-    idx = MOVIES_LIST.index(movie_title)
-    corr_vector = MOVIES_CORR[idx]
-
-    sorted_idx = np.argsort(corr_vector)[::-1]
-    similar_idx = [i for i in sorted_idx if i != idx and corr_vector[i] > 0][:top_k]
+    # vicini già ordinati e senza il film stesso; con le liste precalcolate top_k oltre NEIGHBORS_K viene troncato
+    similar_idx, similar_scores = NEIGHBORS.similar(int(rows[0]), top_k)
 
-    if not similar_idx:
+    if similar_idx.size == 0:
         return {
             "status": "no_match",
             "message": f"No similar movies found for '{movie_title}'.",
             "results": []
         }
 
-    top_movies = [MOVIES_LIST[i] for i in similar_idx]
-    top_scores = [float(corr_vector[i]) for i in similar_idx]
-    score_map = {title: score for title, score in zip(top_movies, top_scores)}
-
-    subset = df[df["movie_title"].isin(top_movies)].copy()
-    subset["__order"] = subset["movie_title"].map({t: k for k, t in enumerate(top_movies)})
-    subset = subset.sort_values("__order")
-    subset["similarity"] = subset["movie_title"].map(score_map)
-    subset = subset.drop(columns="__order")
+    # righe del catalogo per movie_id: un risultato per vicino, anche con titoli duplicati
+    rows = CATALOG.rows_for_ids(MOVIES_IDS[similar_idx])
+    found = rows >= 0
+    results = RECORDS.build(rows[found], selected,
+                            similarity=np.asarray(similar_scores, dtype=np.float64)[found])
+    return ORJSONResponse({"status": "ok", "input_movie": movie_title, "count": len(results), "results": results})
+
+@app.get("/movies/search")
+def search_movies(prefix: str, limit: int = 10):
+    # autocompletamento dei titoli (senza accenti né maiuscole) tramite l'indice ordinato
+    if not prefix.strip():
+        raise HTTPException(status_code=400, detail="prefix non può essere vuoto")
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit deve essere positivo")
+
+    rows = CATALOG.titles.search(prefix, min(limit, 50))
+    results = [
+        {"movie_id": int(CATALOG.movie_id[r]), "movie_title": CATALOG.frame["movie_title"].iat[r]}
+        for r in rows
+    ]
+    return {"status": "ok", "prefix": prefix, "count": len(results), "results": results}
+
+def recommendations_payload(user_id: str, pref: Dict[str, Any], top_k: int = 5,
+                            fields: str | None = None) -> Dict[str, Any]:
+    """
+    Corpo della risposta di /recommendations per un profilo (usato anche dalla
+    valutazione in-process di eval_recsys.py, senza HTTP).
+    """
+    selected = request_fields(fields)
+    rows, scores = user_recommend(user_id, pref, top_k)
+    if rows.size == 0:
+        return {"status": "no_match", "message": f"No recommendations found for '{user_id}' with current preferences.", "results": []}
 
-    results = clean_results(subset)
-    return {"status": "ok", "input_movie": movie_title, "count": len(results), "results": results}
+    results = RECORDS.build(rows, selected, score=scores)
+    return {"status": "ok", "user_id": user_id, "count": len(results), "results": results}
 
 @app.get("/recommendations/{user_id}")
-def get_recommendations(user_id: str, top_k: int = 5):
-    users = load_users()
-    if user_id not in users:
+def get_recommendations(user_id: str, top_k: int = 5, fields: str | None = None):
+    pref = USERS.get(user_id)
+    if pref is None:
         return {"status": "no_match", "message": f"User '{user_id}' not found.", "results": []}
+    return ORJSONResponse(recommendations_payload(user_id, pref, top_k, fields))
 
-    recs_df = recommend_movies(df, users[user_id], top_k=top_k)
-    if recs_df.empty:
-        return {"status": "no_match", "message": f"No recommendations found for '{user_id}' with current preferences.", "results": []}
+@app.get("/recommendations_hybrid/{user_id}")
+def get_recommendations_hybrid(user_id: str, top_k: int = 5, fields: str | None = None):
+    selected = request_fields(fields)
+    pref = USERS.get(user_id)
+    if pref is None:
+        return {"status": "no_match", "message": f"User '{user_id}' not found.", "results": []}
 
-    results = clean_results(recs_df)
-    return {"status": "ok", "user_id": user_id, "count": len(results), "results": results}
+    # liked_movie -> righe del catalogo (titoli duplicati: la prima con embedding fa da riferimento)
+    liked_movie = pref.get("liked_movie") or None
+    liked_rows = CATALOG.titles.lookup(liked_movie) if liked_movie else np.empty(0, dtype=np.int32)
+    with_embedding = liked_rows[_embedding_rows[liked_rows] >= 0]
+    query = CATALOG_EMBEDDINGS[with_embedding[0]] if with_embedding.size else None
 
-@app.get("/recommendations_bandit/{user_id}")
-def get_recommendations_bandit(user_id: str,
-                               top_k: int = 5,
-                               epsilon: float = 0.2,
-                               candidate_pool: int = 100,
-                               explore_extra: int = 200,
-                               seed: int | None = None):
-    users = load_users()
-    if user_id not in users:
-        return {"status": "no_match", "message": f"User '{user_id}' not found.", "results": []}
+    rows, scores, content, similarity = CATALOG.recommend_hybrid(
+        pref, CATALOG_EMBEDDINGS, query, top_k=top_k, exclude=liked_rows,
+    )
+    if rows.size == 0:
+        return {"status": "no_match", "message": f"No recommendations found for '{user_id}' with current preferences.", "results": []}
 
-    exploit_pool, explore_pool = build_pools(df, users[user_id],
-                                             candidate_pool=candidate_pool,
-                                             explore_extra=explore_extra)
-    if exploit_pool.empty and explore_pool.empty:
+    results = RECORDS.build(rows, selected,
+                            score=scores, content_score=content, similarity=similarity)
+    return ORJSONResponse({
+        "status": "ok",
+        "user_id": user_id,
+        "liked_movie": liked_movie,
+        # False: liked_movie assente o senza embedding, classifica solo constraint-based
+        "liked_movie_found": query is not None,
+        "count": len(results),
+        "results": results,
+    })
+
+@app.get("/recommendations_user_cf/{user_id}")
+def get_recommendations_user_cf(user_id: int, top_k: int = 5, fields: str | None = None):
+    selected = request_fields(fields)
+    # user_id dei rating MovieLens (ratings.csv); candidati già senza i film votati, top_k <= USER_CF_TOP_N
+    if USER_CF is None:
+        raise HTTPException(status_code=503, detail="Candidati user-based non calcolati: eseguire user_cf.py")
+    found = USER_CF.get(user_id, top_k)
+    if found is None:
+        return {"status": "no_match", "message": f"Rating user '{user_id}' not found.", "results": []}
+
+    movie_ids, scores = found
+    rows = CATALOG.rows_for_ids(movie_ids)
+    ok = rows >= 0
+    if not ok.any():
+        return {"status": "no_match", "message": f"No candidates found for rating user '{user_id}'.", "results": []}
+
+    results = RECORDS.build(rows[ok], selected, score=scores[ok].astype(np.float64))
+    return ORJSONResponse({"status": "ok", "user_id": user_id, "count": len(results), "results": results})
+
+@app.post("/recommendations/batch")
+def get_recommendations_batch(req: BatchRecommendationRequest, fields: str | None = None):
+    selected = request_fields(fields)
+    # user_id ed etichette inline condividono le chiavi di "results"
+    clashes = sorted(set(req.user_ids).intersection(req.preferences))
+    if clashes:
+        raise HTTPException(status_code=422, detail=f"etichette di preferences uguali a user_ids: {clashes}")
+
+    users = USERS.get_many(req.user_ids)
+    missing = [uid for uid in req.user_ids if uid not in users]
+    labels = [uid for uid in req.user_ids if uid in users]
+    prefs = [users[uid] for uid in labels]
+    for label, p in req.preferences.items():
+        labels.append(label)
+        prefs.append(normalize_prefs(p))
+
+    ranked = CATALOG.recommend_batch(prefs, top_k=req.top_k)
+
+    # una sola serializzazione per tutti gli utenti, poi split per offset
+    all_rows = np.concatenate([rows for rows, _ in ranked]) if ranked else np.empty(0, dtype=np.intp)
+    all_scores = np.concatenate([scores for _, scores in ranked]) if ranked else np.empty(0)
+    records = RECORDS.build(all_rows, selected, score=all_scores)
+
+    results, offset = {}, 0
+    for label, (rows, _) in zip(labels, ranked):
+        results[label] = records[offset:offset + rows.size]
+        offset += rows.size
+
+    return ORJSONResponse({"status": "ok", "count": len(results), "missing": missing, "results": results})
+
+def bandit_payload(user_id: str,
+                   pref: Dict[str, Any],
+                   top_k: int = 5,
+                   epsilon: float = 0.2,
+                   candidate_pool: int = 100,
+                   explore_extra: int = 200,
+                   seed: int | None = None,
+                   fields: str | None = None) -> Dict[str, Any]:
+    """
+    Corpo della risposta di /recommendations_bandit per un profilo (usato anche
+    dalla valutazione in-process di eval_recsys.py, senza HTTP).
+    """
+    selected = request_fields(fields)
+    # un solo generatore per pool e scelte: con seed la risposta è riproducibile
+    rng = np.random.default_rng(seed)
+    pools = build_pools(df, pref,
+                        candidate_pool=candidate_pool,
+                        explore_extra=explore_extra,
+                        rng=rng)
+    if pools.empty:
         return {"status": "no_match", "message": f"No candidates found for '{user_id}'.", "results": []}
 
-    bandit_df = epsilon_greedy_from_pools(exploit_pool, explore_pool,
-                                          users[user_id],
-                                          top_k=top_k,
-                                          epsilon=epsilon,
-                                          seed=seed)
+    rows, scores, strategies = epsilon_greedy_picks(pools,
+                                                    top_k=top_k,
+                                                    epsilon=epsilon,
+                                                    rng=rng)
 
-    results = clean_results(bandit_df)
-    novel_titles = [r["movie_title"] for r in results if r.get("novel")]
+    novel = pools.novel[rows]
+    results = RECORDS.build(rows, selected,
+                            score=scores,
+                            novel=novel,
+                            novelty_reason=novelty_reasons(pools.novelty_codes[rows]),
+                            pick_strategy=strategies)
+    novel_titles = CATALOG.frame["movie_title"].to_numpy()[rows[novel]].tolist()
 
     diag = {
-        "exploit_pool_size": int(exploit_pool.shape[0]),
-        "explore_pool_size": int(explore_pool.shape[0]),
+        "exploit_pool_size": int(pools.exploit_rows.size),
+        "explore_pool_size": int(pools.explore_rows.size),
         "explore_ratio": round(len(novel_titles) / max(1, len(results)), 3)
     }
 
@@ -393,18 +490,40 @@ def get_recommendations_bandit(user_id: str,
         "results": results
     }
 
+@app.get("/recommendations_bandit/{user_id}")
+def get_recommendations_bandit(user_id: str,
+                               top_k: int = 5,
+                               epsilon: float = 0.2,
+                               candidate_pool: int = 100,
+                               explore_extra: int = 200,
+                               seed: int | None = None,
+                               fields: str | None = None):
+    pref = USERS.get(user_id)
+    if pref is None:
+        return {"status": "no_match", "message": f"User '{user_id}' not found.", "results": []}
+    return ORJSONResponse(bandit_payload(user_id, pref, top_k, epsilon, candidate_pool,
+                                         explore_extra, seed, fields))
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"status": "ok", "catalog_version": CATALOG.version, "recommendations": RECS_CACHE.stats()}
+
 @app.get("/users")
-def list_users():
-    users = load_users()
-    user_ids = sorted(list(users.keys()))
-    return {"status": "ok", "users": user_ids}
+def list_users(limit: int | None = None, cursor: str | None = None):
+    # senza limit restituisce tutti gli id (compatibilità con frontend ed eval)
+    if limit is None:
+        return {"status": "ok", "users": USERS.ids()}
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit deve essere positivo")
+    user_ids, next_cursor = USERS.page(limit, cursor)
+    return {"status": "ok", "users": user_ids, "next_cursor": next_cursor}
 
 @app.get("/users/{user_id}")
 def get_user_preferences(user_id: str):
-    users = load_users()
-    if user_id not in users:
+    pref = USERS.get(user_id)
+    if pref is None:
         return {"status": "no_match", "message": f"User '{user_id}' not found.", "results": []}
-    return {"status": "ok", "user_id": user_id, "preferences": users[user_id]}
+    return {"status": "ok", "user_id": user_id, "preferences": pref}
 
 # CREA nuovo utente (fallisce se esiste già)
 @app.post("/users", status_code=201)
@@ -413,13 +532,11 @@ def create_user(req: CreateUserRequest):
     if not user_id:
         raise HTTPException(status_code=400, detail="user_id mancante o vuoto")
 
-    users = load_users()
-    if user_id in users:
+    prefs = USERS.create(user_id, req.preferences)
+    if prefs is None:
         raise HTTPException(status_code=409, detail=f"User '{user_id}' already exists")
-
-    prefs = normalize_prefs(req.preferences)
-    users[user_id] = prefs
-    save_users(users)
+    invalidate_recommendations(prefs)
+    refresh_user_recommendations(user_id, prefs)
 
     return {
         "status": "ok",
@@ -435,10 +552,10 @@ def set_user_preferences(user_id: str, prefs: Dict[str, Any]):
     if not uid:
         raise HTTPException(status_code=400, detail="user_id non valido")
 
-    normalized = normalize_prefs(prefs)
-    users = load_users()
-    users[uid] = normalized
-    save_users(users)
+    previous = USERS.get(uid)
+    normalized = USERS.set(uid, prefs)
+    invalidate_recommendations(previous, normalized)
+    refresh_user_recommendations(uid, normalized)
     return {
         "status": "ok",
         "message": f"Preferences for {uid} saved successfully",
@@ -0,0 +1,248 @@
+from typing import Any, Dict, Optional, Tuple
+
+import argparse
+import atexit
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+import config
+from cache import prefs_key
+from catalog import Catalog
+
+
+class RecommendationTable:
+    """
+    Top-N constraint-based materializzati per ogni utente.
+
+    Ogni riga ricorda l'hash delle preferenze (`prefs_key`) con cui è stata
+    calcolata e la tabella la versione del catalogo: una riga vale solo se
+    entrambi coincidono con quelli correnti, altrimenti chi legge ricalcola.
+    Le righe aggiornate dal server dopo l'avvio (create/set utente) stanno in
+    memoria sopra quelle caricate e, se la tabella ha un `path`, vengono salvate
+    in differita (write-behind, rename atomico) come users.json: dopo un riavvio
+    il server le ritrova senza attendere il job.
+
+    :param user_ids: id utente di ogni riga
+    :param keys: hash delle preferenze di ogni riga
+    :param movie_ids: matrice (utenti, top_n) int32 dei movie_id, -1 = posto vuoto
+    :param scores: matrice (utenti, top_n) float32 dei punteggi, NaN = posto vuoto
+    :param catalog_version: `Catalog.version` del catalogo usato
+    :param path: file su cui salvare le righe aggiornate (None = solo in memoria)
+    :param write_delay: secondi di attesa prima del salvataggio (più aggiornamenti -> una scrittura)
+    """
+
+    def __init__(self, user_ids, keys, movie_ids: np.ndarray, scores: np.ndarray, catalog_version: str,
+                 path=None, write_delay: float = config.RECS_TABLE_WRITE_DELAY):
+        self.user_ids = [str(u) for u in user_ids]
+        self.keys = [str(k) for k in keys]
+        self.movie_ids = movie_ids
+        self.scores = scores
+        self.catalog_version = catalog_version
+        self.top_n = movie_ids.shape[1]
+        # user_id -> riga (lookup O(1))
+        self.row_of = {uid: i for i, uid in enumerate(self.user_ids)}
+        self._updates: Dict[str, Tuple[str, np.ndarray, np.ndarray]] = {}
+
+        self.path = path
+        self.write_delay = write_delay
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+        if path is not None:
+            atexit.register(self.flush)
+
+    @classmethod
+    def load(cls, path=config.RECS_TABLE_FILE, persist: bool = False) -> "RecommendationTable":
+        """
+        :param persist: salva su `path` le righe aggiornate con `update`
+        """
+        with np.load(path) as f:
+            return cls(f["user_ids"], f["keys"], f["movie_ids"], f["scores"], str(f["catalog_version"]),
+                       path=path if persist else None)
+
+    def save(self, path):
+        """
+        Scrive la tabella (righe aggiornate comprese) su un file temporaneo poi
+        rinominato in modo atomico: chi legge vede la versione vecchia o la nuova.
+        """
+        with self._lock:
+            updates = dict(self._updates)
+        self._write(path, self.user_ids, self.keys, self.movie_ids, self.scores, updates)
+
+    def _write(self, path, user_ids, keys, movie_ids: np.ndarray, scores: np.ndarray, updates: Dict):
+        user_ids, keys = list(user_ids), list(keys)
+        if updates:
+            row_of = {uid: i for i, uid in enumerate(user_ids)}
+            new = [uid for uid in updates if uid not in row_of]
+            pad = np.full((len(new), self.top_n), -1, dtype=np.int32)
+            movie_ids = np.concatenate([movie_ids, pad])
+            scores = np.concatenate([scores, np.full(pad.shape, np.nan, dtype=np.float32)])
+            user_ids += new
+            keys += [""] * len(new)
+            row_of.update((uid, len(row_of) + i) for i, uid in enumerate(new))
+            for uid, (key, ids, sc) in updates.items():
+                i = row_of[uid]
+                keys[i], movie_ids[i], scores[i] = key, ids, sc
+
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=os.path.basename(path), suffix=".tmp.npz")
+        os.close(fd)
+        try:
+            np.savez(
+                tmp,
+                user_ids=np.array(user_ids, dtype=str),
+                keys=np.array(keys, dtype=str),
+                movie_ids=movie_ids,
+                scores=scores,
+                catalog_version=np.array(self.catalog_version),
+            )
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def flush(self):
+        """
+        Salva subito su `path` le righe aggiornate in attesa.
+
+        Le righe già sul file (scritte dal job o da altri worker) sono rilette e
+        tenute, sostituendo solo quelle aggiornate qui; se due worker salvano
+        insieme l'ultimo vince, e una riga persa ha solo un hash vecchio: chi
+        legge la ignora e ricalcola.
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty or self.path is None:
+                return
+            updates = dict(self._updates)
+            self._dirty = False
+
+        base = (self.user_ids, self.keys, self.movie_ids, self.scores)
+        if os.path.exists(self.path):
+            with np.load(self.path) as f:
+                if str(f["catalog_version"]) == self.catalog_version and f["movie_ids"].shape[1] == self.top_n:
+                    base = (f["user_ids"].tolist(), f["keys"].tolist(), f["movie_ids"], f["scores"])
+        try:
+            self._write(self.path, *base, updates)
+        except BaseException:
+            with self._lock:
+                self._dirty = True
+            raise
+
+    def lookup(self, user_id: str, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Riga completa (movie_id e punteggi validi) dell'utente, o None se manca
+        o è stata calcolata con preferenze diverse.
+        """
+        entry = self._updates.get(user_id)
+        if entry is None:
+            row = self.row_of.get(user_id)
+            if row is None:
+                return None
+            entry = (self.keys[row], self.movie_ids[row], self.scores[row])
+        row_key, movie_ids, scores = entry
+        if row_key != key:
+            return None
+        valid = movie_ids >= 0
+        return movie_ids[valid], scores[valid]
+
+    def get(self, user_id: str, key: str, top_k: int) -> Optional[np.ndarray]:
+        """
+        Primi `top_k` movie_id dell'utente, o None se la riga non è utilizzabile
+        (assente, preferenze cambiate, o top_k oltre top_n con lista piena).
+        """
+        hit = self.lookup(user_id, key)
+        if hit is None:
+            return None
+        movie_ids = hit[0]
+        # una lista più corta di top_n contiene già tutti i film ammessi
+        if top_k > movie_ids.size == self.top_n:
+            return None
+        return movie_ids[:max(top_k, 0)]
+
+    def update(self, user_id: str, key: str, movie_ids: np.ndarray, scores: np.ndarray):
+        """
+        Aggiorna la riga di un utente (preferenze create o modificate) e, con un
+        `path`, ne programma il salvataggio.
+        """
+        ids = np.full(self.top_n, -1, dtype=np.int32)
+        sc = np.full(self.top_n, np.nan, dtype=np.float32)
+        n = min(movie_ids.size, self.top_n)
+        ids[:n], sc[:n] = movie_ids[:n], scores[:n]
+        with self._lock:
+            self._updates[user_id] = (key, ids, sc)
+            if self.path is None:
+                return
+            self._dirty = True
+            if self.write_delay > 0 and self._timer is None:
+                self._timer = threading.Timer(self.write_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.write_delay <= 0:
+            self.flush()
+
+
+def build_table(catalog: Catalog,
+                users: Dict[str, Dict[str, Any]],
+                top_n: int = config.RECS_TABLE_TOP_N,
+                previous: Optional[RecommendationTable] = None) -> Tuple[RecommendationTable, int]:
+    """
+    Tabella dei top-N per tutti gli utenti, riusando le righe ancora valide di `previous`.
+
+    Con stessa versione del catalogo e stesso top_n si ricalcolano solo gli utenti
+    nuovi o con preferenze cambiate (scoring batch); altrimenti tutti.
+
+    :return: (tabella, numero di utenti ricalcolati)
+    """
+    user_ids = sorted(users)
+    keys = [prefs_key(users[uid]) for uid in user_ids]
+    movie_ids = np.full((len(user_ids), top_n), -1, dtype=np.int32)
+    scores = np.full((len(user_ids), top_n), np.nan, dtype=np.float32)
+
+    reuse = previous is not None and previous.catalog_version == catalog.version and previous.top_n == top_n
+    todo = []
+    for i, (uid, key) in enumerate(zip(user_ids, keys)):
+        hit = previous.lookup(uid, key) if reuse else None
+        if hit is None:
+            todo.append(i)
+        else:
+            movie_ids[i, :hit[0].size], scores[i, :hit[1].size] = hit
+
+    ranked = catalog.recommend_batch([users[user_ids[i]] for i in todo], top_k=top_n)
+    for i, (rows, s) in zip(todo, ranked):
+        movie_ids[i, :rows.size] = catalog.movie_id[rows]
+        scores[i, :rows.size] = s
+
+    return RecommendationTable(user_ids, keys, movie_ids, scores, catalog.version), len(todo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Materializza i top-N constraint-based di tutti gli utenti.")
+    parser.add_argument("--full", action="store_true", help="ricalcola tutti gli utenti")
+    args = parser.parse_args()
+
+    # stesso catalogo e repository utenti del server, senza importare l'app
+    # (main.py carica tutti gli artefatti)
+    from catalog_store import load_movies
+    from prefs import normalize_prefs
+    from user_store import open_user_store
+
+    t0 = time.perf_counter()
+    catalog = Catalog(load_movies())
+    users = open_user_store(normalize=normalize_prefs)
+    previous = None
+    if not args.full and config.RECS_TABLE_FILE.exists():
+        previous = RecommendationTable.load(config.RECS_TABLE_FILE)
+    table, computed = build_table(catalog, users.all(), previous=previous)
+    table.save(config.RECS_TABLE_FILE)
+    print(f"Salvato {config.RECS_TABLE_FILE}: {len(table.user_ids)} utenti, {computed} ricalcolati, "
+          f"{time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
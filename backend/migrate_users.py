@@ -0,0 +1,32 @@
+import argparse
+import json
+from pathlib import Path
+
+import config
+from prefs import normalize_prefs
+from user_store import SqliteUserStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra gli utenti da users.json al database SQLite.")
+    parser.add_argument("--src", type=Path, default=config.USERS_FILE, help="file users.json di partenza")
+    parser.add_argument("--dst", type=Path, default=config.USERS_DB_FILE, help="database SQLite di destinazione")
+    parser.add_argument("--replace", action="store_true",
+                        help="svuota il database prima della migrazione (default: upsert)")
+    args = parser.parse_args()
+
+    with open(args.src, "r", encoding="utf-8") as f:
+        users = json.load(f)
+
+    store = SqliteUserStore(args.dst, normalize=normalize_prefs)
+    if args.replace:
+        store.replace_all(users)
+    else:
+        for uid, prefs in users.items():
+            store.set(uid, prefs)
+
+    print(f"Migrati {len(users)} utenti da {args.src} a {args.dst} ({len(store.ids())} nel database)")
+
+
+if __name__ == "__main__":
+    main()
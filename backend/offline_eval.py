@@ -0,0 +1,220 @@
+from typing import Callable, Dict, Tuple
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+import config
+from catalog import top_k_rows
+from similarity import normalize_rows
+
+
+def leave_last_n_out(ratings: pd.DataFrame, n: int = config.OFFLINE_LAST_N) -> np.ndarray:
+    """
+    Maschera del test: gli ultimi `n` rating (per timestamp) di ogni utente che
+    ne ha più di `n`; a parità di timestamp decide il movie_id.
+    """
+    user = ratings["user_id"].to_numpy()
+    order = np.lexsort((ratings["movie_id"].to_numpy(), ratings["timestamp"].to_numpy(), user))
+    sorted_user = user[order]
+    # posizione dalla fine all'interno dei rating (ordinati) dello stesso utente
+    starts = np.flatnonzero(np.r_[True, sorted_user[1:] != sorted_user[:-1]])
+    counts = np.diff(np.r_[starts, sorted_user.size])
+    from_end = np.repeat(starts + counts, counts) - 1 - np.arange(sorted_user.size)
+    test = np.zeros(user.size, dtype=bool)
+    test[order] = (from_end < n) & (np.repeat(counts, counts) > n)
+    return test
+
+
+def time_cut(ratings: pd.DataFrame, fraction: float = config.OFFLINE_TEST_FRACTION) -> Tuple[np.ndarray, int]:
+    """
+    Maschera del test per un taglio temporale globale: i rating dall'istante che
+    separa la frazione `fraction` più recente in poi.
+
+    :return: (maschera, timestamp del taglio)
+    """
+    ts = ratings["timestamp"].to_numpy()
+    cut = int(np.quantile(ts, 1.0 - fraction, method="higher"))
+    return ts >= cut, cut
+
+
+def _codes(values: np.ndarray, index: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # posizione di ogni valore in `index` (ordinato) e maschera dei valori presenti
+    pos = np.minimum(np.searchsorted(index, values), max(index.size - 1, 0))
+    found = index[pos] == values if index.size else np.zeros(values.size, dtype=bool)
+    return pos, found
+
+
+def user_item_matrix(user_ids, movie_ids, values, users: np.ndarray, items: np.ndarray) -> csr_matrix:
+    """
+    Matrice CSR (utenti, film) sugli id indicati (ordinati); le coppie fuori da
+    `users` o `items` sono scartate.
+    """
+    rows, ok_u = _codes(np.asarray(user_ids), users)
+    cols, ok_i = _codes(np.asarray(movie_ids), items)
+    keep = ok_u & ok_i
+    return csr_matrix((np.asarray(values, dtype=np.float32)[keep], (rows[keep], cols[keep])),
+                      shape=(users.size, items.size))
+
+
+def rank_top_k(train: csr_matrix,
+               score_block: Callable[[int, int], np.ndarray],
+               top_k: int) -> np.ndarray:
+    """
+    Primi `top_k` film per ogni utente, a blocchi di utenti (al più
+    config.BATCH_MAX_CELLS celle di punteggi per blocco), esclusi i film del train.
+
+    :param score_block: (start, stop) -> punteggi densi float32 (stop - start, film)
+    :return: matrice (utenti, top_k) di indici di colonna, -1 = posto vuoto
+    """
+    n_users, n_items = train.shape
+    k = min(top_k, n_items)
+    top = np.full((n_users, top_k), -1, dtype=np.int32)
+    chunk = max(1, config.BATCH_MAX_CELLS // max(n_items, 1))
+    for start in range(0, n_users, chunk):
+        stop = min(start + chunk, n_users)
+        scores = np.asarray(score_block(start, stop), dtype=np.float32)
+        own = train[start:stop]
+        scores[np.repeat(np.arange(stop - start), np.diff(own.indptr)), own.indices] = -np.inf
+        idx = top_k_rows(scores, k)
+        valid = np.isfinite(np.take_along_axis(scores, idx, axis=1))
+        top[start:stop, :k] = np.where(valid, idx, -1)
+    return top
+
+
+def ranking_metrics(top: np.ndarray, relevant: csr_matrix, n_relevant: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    precision@k, recall@k e NDCG@k (guadagno binario, sconto 1/log2(posizione + 1))
+    per ogni utente, senza cicli sugli utenti.
+
+    :param top: (utenti, k) indici di colonna raccomandati, -1 = posto vuoto
+    :param relevant: (utenti, film) 1 se il film del test è rilevante per l'utente
+    :param n_relevant: film rilevanti per utente, compresi quelli assenti dal train
+                       (non raccomandabili ma nel denominatore del recall)
+    """
+    k = top.shape[1]
+    hits = np.zeros(top.shape, dtype=bool)
+    chunk = max(1, config.BATCH_MAX_CELLS // max(relevant.shape[1], 1))
+    for start in range(0, top.shape[0], chunk):
+        stop = min(start + chunk, top.shape[0])
+        block = relevant[start:stop].toarray() > 0
+        t = top[start:stop]
+        hits[start:stop] = np.take_along_axis(block, np.maximum(t, 0), axis=1) & (t >= 0)
+
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    ideal = np.cumsum(discounts)[np.clip(n_relevant, 1, k) - 1]
+    n_hits = hits.sum(axis=1)
+    return {
+        "precision@k": n_hits / k,
+        "recall@k": n_hits / np.maximum(n_relevant, 1),
+        "ndcg@k": (hits @ discounts) / ideal,
+    }
+
+
+def evaluate_split(ratings: pd.DataFrame,
+                   test: np.ndarray,
+                   top_k: int = config.OFFLINE_TOP_K,
+                   min_rating: float = config.OFFLINE_MIN_RATING) -> dict:
+    """
+    Addestra la SVD sui soli rating di train e valuta le liste di tutti gli utenti
+    con almeno un rating di train e un film rilevante nel test.
+
+    Metodi:
+    - "svd": somma delle correlazioni SVD (come /similar_movies) con i film
+      votati nel train, pesate dal voto;
+    - "popularity": film con più rating nel train (riferimento).
+
+    :param test: maschera dei rating di test (leave_last_n_out o time_cut)
+    :return: dimensioni dello split, medie delle metriche per metodo e tempi
+    """
+    # precompute importa sklearn: caricato solo dalla valutazione, non dal server
+    from precompute import fit_model
+
+    t0 = time.perf_counter()
+    train_df, test_df = ratings[~test], ratings[test]
+    model = fit_model(train_df, np.unique(train_df["movie_id"].to_numpy()))
+    items = model["movie_ids"]
+    t_fit = time.perf_counter() - t0
+
+    relevant_df = test_df[test_df["rating"] >= min_rating]
+    users = np.intersect1d(np.unique(train_df["user_id"].to_numpy()), np.unique(relevant_df["user_id"].to_numpy()))
+    R = user_item_matrix(train_df["user_id"], train_df["movie_id"], train_df["rating"], users, items)
+    T = user_item_matrix(relevant_df["user_id"], relevant_df["movie_id"], np.ones(len(relevant_df)), users, items)
+    rel_users, ok = _codes(relevant_df["user_id"].to_numpy(), users)
+    n_relevant = np.bincount(rel_users[ok], minlength=users.size)
+
+    # profilo dell'utente nello spazio delle correlazioni: punteggio di un film =
+    # somma delle sue correlazioni con i film votati, pesate dal voto
+    # punteggi in float32: il ranking a blocchi è limitato dalla banda di memoria
+    Z = normalize_rows(model["item_factors"]).astype(np.float32)
+    profiles = np.asarray(R @ Z)
+    popularity = np.diff(R.tocsc().indptr).astype(np.float32)
+
+    scorers = {
+        "svd": lambda a, b: profiles[a:b] @ Z.T,
+        "popularity": lambda a, b: np.tile(popularity, (b - a, 1)),
+    }
+    methods, timing = {}, {"fit_s": round(t_fit, 3)}
+    for name, score_block in scorers.items():
+        t1 = time.perf_counter()
+        metrics = ranking_metrics(rank_top_k(R, score_block, top_k), T, n_relevant)
+        timing[f"{name}_s"] = round(time.perf_counter() - t1, 3)
+        methods[name] = {key: round(float(values.mean()), 4) if values.size else 0.0
+                         for key, values in metrics.items()}
+
+    return {
+        "train_ratings": int(len(train_df)),
+        "test_ratings": int(len(test_df)),
+        "relevant_ratings": int(len(relevant_df)),
+        "users_evaluated": int(users.size),
+        "items_trained": int(items.size),
+        "methods": methods,
+        "timing": timing,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione offline su ratings.csv con split temporali.")
+    parser.add_argument("--ratings", default=str(config.RATINGS_FILE), help="CSV user_id,movie_id,rating,timestamp")
+    parser.add_argument("--split", choices=["last-n", "time", "both"], default="both")
+    parser.add_argument("--last-n", type=int, default=config.OFFLINE_LAST_N)
+    parser.add_argument("--test-fraction", type=float, default=config.OFFLINE_TEST_FRACTION)
+    parser.add_argument("--top-k", type=int, default=config.OFFLINE_TOP_K)
+    parser.add_argument("--min-rating", type=float, default=config.OFFLINE_MIN_RATING,
+                        help="voto minimo di un film del test perché sia rilevante")
+    parser.add_argument("--output", default="results_offline.json")
+    args = parser.parse_args()
+
+    from precompute import load_ratings
+
+    t0 = time.perf_counter()
+    ratings = load_ratings(args.ratings, timestamps=True)
+    splits = {}
+    if args.split in ("last-n", "both"):
+        splits[f"leave_last_{args.last_n}_out"] = {"test": leave_last_n_out(ratings, args.last_n)}
+    if args.split in ("time", "both"):
+        test, cut = time_cut(ratings, args.test_fraction)
+        splits[f"time_cut_{args.test_fraction:g}"] = {"test": test, "cut_timestamp": cut}
+
+    out = {
+        "settings": {"ratings": args.ratings, "top_k": args.top_k, "min_rating": args.min_rating,
+                     "svd_components": config.SVD_COMPONENTS},
+        "splits": {},
+    }
+    for name, split in splits.items():
+        result = evaluate_split(ratings, split.pop("test"), args.top_k, args.min_rating)
+        out["splits"][name] = {**split, **result}
+        line = "  ".join(f"{m}: " + " ".join(f"{k} {v:.4f}" for k, v in vals.items())
+                         for m, vals in result["methods"].items())
+        print(f"{name}: {result['users_evaluated']} utenti  {line}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(out, f, indent=2, ensure_ascii=False)
+    print(f"Salvato {args.output} ({time.perf_counter() - t0:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,267 @@
 import pandas as pd
 import numpy as np
+from scipy.sparse import csr_matrix
 from sklearn.decomposition import TruncatedSVD
+import argparse
 import json
+import os
+import tempfile
 import config
+from similarity import top_k_neighbors, refresh_neighbors, normalize_rows
+from ann import RandomProjectionIndex
+from catalog_store import read_movies_csv, save_catalog
+
+def load_ratings(path=config.RATINGS_FILE, timestamps: bool = False) -> pd.DataFrame:
+    """
+    Legge solo le colonne utili dei rating con tipi compatti (int32 / float32).
+
+    :param timestamps: legge anche `timestamp` (int64), per gli split temporali
+    """
+    columns = ["user_id", "movie_id", "rating"] + (["timestamp"] if timestamps else [])
+    return pd.read_csv(
+        path,
+        usecols=columns,
+        dtype={"user_id": np.int32, "movie_id": np.int32, "rating": np.float32, "timestamp": np.int64},
+    )
+
+def utility_matrix(user_ids: np.ndarray,
+                   movie_ids: np.ndarray,
+                   ratings: np.ndarray,
+                   catalog_ids: np.ndarray | None = None,
+                   users: np.ndarray | None = None):
+    """
+    Matrice utility film x utenti in formato CSR, costruita direttamente dai codici interi.
+
+    Nessuna tabella densa: gli id vengono tradotti in indici di riga/colonna
+    con `np.unique`/`searchsorted` e i rating finiscono nella matrice sparsa.
+    I film sono ordinati per movie_id (titoli duplicati restano film distinti).
+
+    :param user_ids: id utente per rating
+    :param movie_ids: id film per rating
+    :param ratings: valore del rating
+    :param catalog_ids: se indicato, tiene solo i film presenti nel catalogo
+    :param users: se indicato, colonne fissate a questi id utente (ordinati);
+                  i rating di altri utenti sono scartati
+    :return: (matrice CSR float32 (film, utenti), movie_id int32 di ogni riga, user_id di ogni colonna)
+    """
+    user_ids = np.asarray(user_ids)
+    movie_ids = np.asarray(movie_ids)
+    ratings = np.asarray(ratings, dtype=np.float32)
+
+    keep = np.ones(ratings.size, dtype=bool)
+    if catalog_ids is not None:
+        keep &= np.isin(movie_ids, catalog_ids)
+    if users is not None:
+        keep &= np.isin(user_ids, users)
+    if not keep.all():
+        user_ids, movie_ids, ratings = user_ids[keep], movie_ids[keep], ratings[keep]
+
+    item_ids, item_codes = np.unique(movie_ids, return_inverse=True)
+    if users is None:
+        users, user_codes = np.unique(user_ids, return_inverse=True)
+    else:
+        user_codes = np.searchsorted(users, user_ids)
+
+    X = csr_matrix(
+        (ratings, (item_codes.astype(np.int32), user_codes.astype(np.int32))),
+        shape=(item_ids.size, users.size),
+        dtype=np.float32,
+    )
+    return X, item_ids.astype(np.int32), np.asarray(users, dtype=np.int32)
+
+def fit_model(ratings: pd.DataFrame, catalog_ids: np.ndarray) -> dict:
+    """
+    Addestra la SVD sulla matrice utility sparsa e ne ricava i vettori latenti dei film.
+
+    I fattori dei film sono la proiezione X @ componenti^T (come `transform`):
+    i film aggiunti in seguito con `update` finiscono nello stesso spazio.
+
+    :return: modello con componenti, user_id delle colonne, movie_id e fattori delle righe
+    """
+    X, movie_ids, users = utility_matrix(
+        ratings["user_id"].to_numpy(),
+        ratings["movie_id"].to_numpy(),
+        ratings["rating"].to_numpy(),
+        catalog_ids=catalog_ids,
+    )
+
+    # SVD (accetta direttamente la matrice sparsa)
+    SVD = TruncatedSVD(n_components=config.SVD_COMPONENTS, random_state=42)
+    SVD.fit(X)
+
+    return {
+        "components": SVD.components_,
+        "user_ids": users,
+        "movie_ids": movie_ids,
+        "item_factors": np.asarray(X @ SVD.components_.T),
+        # film addestrati e film proiettati in seguito (per la soglia di riaddestramento)
+        "fitted_items": np.int64(movie_ids.size),
+        "folded_items": np.int64(0),
+    }
+
+def load_model() -> dict:
+    with np.load(config.SVD_MODEL_FILE) as f:
+        return {key: f[key] for key in f.files}
+
+def save_atomic(path, save):
+    """
+    Scrive un file tramite temporaneo + rename: i worker che lo hanno in mmap
+    continuano a vedere la versione precedente finché non lo riaprono.
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=os.path.splitext(str(path))[1])
+    os.close(fd)
+    try:
+        save(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+def save_artifacts(model: dict, titles: list, neighbors: np.ndarray, scores: np.ndarray):
+    # Salva titolo di ogni riga in JSON (i duplicati restano, la chiave è movie_id)
+    def save_titles(path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(titles, f, ensure_ascii=False, indent=2)
+    save_atomic(config.MOVIES_LIST_FILE, save_titles)
+
+    # Salva modello SVD, movie_id per riga (int32), vicini (int32) e correlazioni (NEIGHBOR_SCORES_DTYPE, senza NaN)
+    save_atomic(config.SVD_MODEL_FILE, lambda p: np.savez(p, **model))
+    save_atomic(config.MOVIES_IDS_FILE, lambda p: np.save(p, model["movie_ids"]))
+    save_atomic(config.MOVIES_NEIGHBORS_FILE, lambda p: np.save(p, neighbors))
+    save_atomic(config.MOVIES_NEIGHBOR_SCORES_FILE, lambda p: np.save(p, scores))
+
+    # Embedding normalizzati (float32) e indice approssimato per /similar_movies con SIMILAR_BACKEND="ann"
+    embeddings = normalize_rows(model["item_factors"]).astype(np.float32)
+    index = RandomProjectionIndex.build(embeddings, config.ANN_TABLES, config.ANN_BITS)
+    save_atomic(config.MOVIES_EMBEDDINGS_FILE, lambda p: np.save(p, embeddings))
+    save_atomic(config.MOVIES_ANN_FILE, index.save)
+
+    print(f"Salvati {config.SVD_MODEL_FILE}, {config.MOVIES_LIST_FILE}, {config.MOVIES_IDS_FILE}, "
+          f"{config.MOVIES_NEIGHBORS_FILE}, {config.MOVIES_NEIGHBOR_SCORES_FILE}, "
+          f"{config.MOVIES_EMBEDDINGS_FILE} e {config.MOVIES_ANN_FILE}")
+
+def write_catalog():
+    """
+    Catalogo film tipizzato (.npz colonnare) caricato dal server all'avvio al posto del CSV.
+    """
+    save_atomic(config.MOVIES_CATALOG_FILE, lambda p: save_catalog(read_movies_csv(), p))
+    print(f"Salvato {config.MOVIES_CATALOG_FILE}")
+
+def titles_for(movies: pd.DataFrame, movie_ids: np.ndarray) -> list:
+    return movies.set_index("movie_id")["movie_title"].reindex(movie_ids).tolist()
+
+def item_embeddings():
+    """
+    Vettori latenti del modello salvato (o di uno nuovo, se manca).
+
+    :return: (movie_id per riga, matrice film x componenti)
+    """
+    if config.SVD_MODEL_FILE.exists():
+        model = load_model()
+    else:
+        movies = pd.read_csv(config.MOVIES_FILE, usecols=["movie_id"])
+        model = fit_model(load_ratings(), movies["movie_id"].to_numpy())
+    return model["movie_ids"], model["item_factors"]
 
 def main():
-    ratings = pd.read_csv(config.RATINGS_FILE)
-    movies = pd.read_csv(config.MOVIES_FILE)
+    ratings = load_ratings()
+    movies = pd.read_csv(config.MOVIES_FILE, usecols=["movie_id", "movie_title"])
 
-    # Merge rating + info film
-    combined_movies_data = pd.merge(ratings, movies, on="movie_id")
+    model = fit_model(ratings, movies["movie_id"].to_numpy())
 
-    # Crea matrice utility (users x movies)
-    rating_utility_matrix = combined_movies_data.pivot_table(
-        values="rating", index="user_id", columns="movie_title", fill_value=0
+    # Primi k vicini film-film per correlazione, calcolati a blocchi di righe
+    neighbors, scores = top_k_neighbors(
+        model["item_factors"], config.NEIGHBORS_K, block_rows=config.CORR_BLOCK_ROWS,
+        dtype=config.NEIGHBOR_SCORES_DTYPE,
     )
 
-    # Transposta per lavorare sui film
-    X = rating_utility_matrix.T
+    save_artifacts(model, titles_for(movies, model["movie_ids"]), neighbors, scores)
+
+def update():
+    """
+    Aggiornamento incrementale: proietta (fold-in) nello spazio latente esistente
+    i film nuovi e quelli con rating cambiati, poi aggiorna solo le liste di vicini toccate.
+
+    I rating di utenti sconosciuti al modello non sono rappresentabili senza
+    riaddestrare: se loro, o i film proiettati dall'ultimo addestramento, superano
+    config.SVD_RETRAIN_FRACTION si riesegue l'addestramento completo.
+    """
+    if not config.SVD_MODEL_FILE.exists():
+        print("Nessun modello salvato: addestramento completo")
+        return main()
 
-    # SVD
-    SVD = TruncatedSVD(n_components=30, random_state=42)
-    transformed_matrix = SVD.fit_transform(X)
+    model = load_model()
+    ratings = load_ratings()
+    movies = pd.read_csv(config.MOVIES_FILE, usecols=["movie_id", "movie_title"])
+    catalog_ids = movies["movie_id"].to_numpy()
+
+    in_catalog = np.isin(ratings["movie_id"].to_numpy(), catalog_ids)
+    unknown_users = ~np.isin(ratings["user_id"].to_numpy(), model["user_ids"]) & in_catalog
+    unknown_fraction = unknown_users.sum() / max(int(in_catalog.sum()), 1)
+
+    # Proiezione di tutti i film sulle colonne utente note: costa un prodotto sparso
+    X, movie_ids, _ = utility_matrix(
+        ratings["user_id"].to_numpy(),
+        ratings["movie_id"].to_numpy(),
+        ratings["rating"].to_numpy(),
+        catalog_ids=catalog_ids,
+        users=model["user_ids"],
+    )
+    factors = np.asarray(X @ model["components"].T)
 
-    # Matrice di correlazione film-film
-    corr_matrix = np.corrcoef(transformed_matrix)
+    rows = pd.Index(model["movie_ids"]).get_indexer(movie_ids)
+    known = rows >= 0
+    differs = (model["item_factors"][rows[known]] != factors[known]).any(axis=1)
+    changed = rows[known][differs]
+    new_ids = movie_ids[~known]
 
-    movies_list = list(rating_utility_matrix.columns)
+    folded = int(model["folded_items"]) + changed.size + new_ids.size
+    if folded > config.SVD_RETRAIN_FRACTION * int(model["fitted_items"]) \
+            or unknown_fraction > config.SVD_RETRAIN_FRACTION:
+        print(f"Soglia superata (film proiettati: {folded}, rating di utenti nuovi: {unknown_fraction:.1%}): "
+              f"addestramento completo")
+        return main()
+    if changed.size == 0 and new_ids.size == 0:
+        print("Nessun film nuovo o modificato")
+        return
 
-    # Salva lista film in JSON
-    with open(config.MOVIES_LIST_FILE, "w", encoding="utf-8") as f:
-        json.dump(movies_list, f, ensure_ascii=False, indent=2)
+    n_old = model["movie_ids"].size
+    item_factors = np.concatenate([model["item_factors"], factors[~known]])
+    item_factors[changed] = factors[known][differs]
+    model["item_factors"] = item_factors
+    model["movie_ids"] = np.concatenate([model["movie_ids"], new_ids]).astype(np.int32)
+    model["folded_items"] = np.int64(folded)
 
-    # Salva matrice in formato npy
-    np.save(config.MOVIES_CORR_FILE, corr_matrix)
+    neighbors = np.load(config.MOVIES_NEIGHBORS_FILE)
+    scores = np.load(config.MOVIES_NEIGHBOR_SCORES_FILE)
+    k = min(config.NEIGHBORS_K, item_factors.shape[0] - 1)
+    if neighbors.shape[1] != k or scores.dtype != np.dtype(config.NEIGHBOR_SCORES_DTYPE):
+        # k o tipo dei punteggi cambiati in config: le liste vanno ricalcolate tutte
+        neighbors, scores = top_k_neighbors(
+            item_factors, config.NEIGHBORS_K, block_rows=config.CORR_BLOCK_ROWS,
+            dtype=config.NEIGHBOR_SCORES_DTYPE,
+        )
+    else:
+        neighbors, scores = refresh_neighbors(
+            item_factors, neighbors, scores,
+            np.concatenate([changed, np.arange(n_old, item_factors.shape[0])]),
+            block_rows=config.CORR_BLOCK_ROWS,
+        )
 
-    print(f"Salvati {config.MOVIES_LIST_FILE} e {config.MOVIES_CORR_FILE}")
+    print(f"Film aggiornati: {changed.size}, nuovi: {new_ids.size}")
+    save_artifacts(model, titles_for(movies, model["movie_ids"]), neighbors, scores)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Precalcolo del modello SVD e dei film simili.")
+    parser.add_argument("--update", action="store_true",
+                        help="fold-in incrementale di film nuovi o con rating cambiati nel modello salvato")
+    parser.add_argument("--catalog", action="store_true",
+                        help="rigenera solo il catalogo binario dei film")
+    args = parser.parse_args()
+    if args.update:
+        update()
+    elif not args.catalog:
+        main()
+    # il catalogo binario segue sempre il CSV corrente
+    write_catalog()
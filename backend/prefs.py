@@ -0,0 +1,51 @@
+from typing import Dict, Any, Optional
+
+# Preferenze degli utenti: default e normalizzazione, condivise da main.py,
+# migrate_users.py e materialize.py senza caricare l'app.
+DEFAULT_PREFS: Dict[str, Any] = {
+    "min_release_year": 0,
+    "generi_desiderati": [],
+    "generi_vietati": [],
+    "prefer_award_winning": False,
+    "preferred_runtime": None,
+    "tolleranza_runtime": 0,
+    "favorite_directors": [],
+}
+
+# campi letti dallo scoring (Catalog): gli altri (es. liked_movie) non cambiano le liste
+SCORING_FIELDS = tuple(DEFAULT_PREFS)
+# campi lista: per lo scoring contano come insiemi di stringhe
+LIST_FIELDS = ("generi_desiderati", "generi_vietati", "favorite_directors")
+
+def normalize_prefs(p: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    p = dict(p or {})
+    out = {**DEFAULT_PREFS, **p}
+
+    # numeri
+    try:
+        out["min_release_year"] = int(out.get("min_release_year", 0) or 0)
+    except Exception:
+        out["min_release_year"] = 0
+
+    try:
+        pr = out.get("preferred_runtime", None)
+        out["preferred_runtime"] = None if pr in (None, "", "null") else int(pr)
+    except Exception:
+        out["preferred_runtime"] = None
+
+    try:
+        out["tolleranza_runtime"] = int(out.get("tolleranza_runtime", 0) or 0)
+    except Exception:
+        out["tolleranza_runtime"] = 0
+
+    # liste
+    for k in LIST_FIELDS:
+        v = out.get(k, [])
+        if isinstance(v, (list, tuple)):
+            out[k] = [str(x) for x in v]
+        else:
+            out[k] = []
+
+    # booleano
+    out["prefer_award_winning"] = bool(out.get("prefer_award_winning", False))
+    return out
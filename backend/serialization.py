@@ -0,0 +1,78 @@
+from typing import Any, Iterable
+
+import numpy as np
+import pandas as pd
+
+
+def frame_records(df_in: pd.DataFrame) -> list[dict]:
+    """
+    Converte un DataFrame in lista di dict serializzabile JSON (NaN -> None, date in "%Y-%m-%d").
+    """
+    df2 = df_in.copy()
+    # date formattate prima di togliere i NaN (dopo la colonna non è più datetime)
+    for col in df2.select_dtypes(include=["datetime"]).columns:
+        df2[col] = df2[col].dt.strftime("%Y-%m-%d").astype(object)
+    df2 = df2.astype(object).where(df2.notna(), None)
+    return df2.to_dict(orient="records")
+
+
+def parse_fields(fields: str | None, allowed: Iterable[str] | None = None) -> tuple[str, ...] | None:
+    """
+    Proiezione `fields=a,b,c` di una richiesta (None = tutti i campi).
+
+    :param allowed: nomi ammessi (None = nessun controllo)
+    :raises ValueError: con i nomi non presenti in `allowed`
+    """
+    if not fields:
+        return None
+    names = tuple(f.strip() for f in fields.split(",") if f.strip())
+    if allowed is not None:
+        allowed = set(allowed)
+        unknown = [f for f in names if f not in allowed]
+        if unknown:
+            raise ValueError(", ".join(unknown))
+    return names
+
+
+def _plain(values: Any) -> list:
+    # array/liste -> tipi Python, con NaN -> None come in frame_records
+    out = values.tolist() if isinstance(values, np.ndarray) else list(values)
+    return [None if isinstance(v, float) and v != v else v for v in out]
+
+
+class RecordSerializer:
+    """
+    Campi statici di ogni film del catalogo già convertiti in dict JSON all'avvio.
+
+    Una risposta copia i dict delle sole righe restituite (eventualmente
+    proiettati su `fields`) e aggiunge i campi calcolati per la richiesta
+    (score, similarity, novel, ...): niente copia del DataFrame, `replace`,
+    `strftime` o `to_dict` per richiesta.
+    """
+
+    def __init__(self, frame: pd.DataFrame):
+        self.records = frame_records(frame)
+        # campi statici proiettabili con fields=
+        self.fields = tuple(str(c) for c in frame.columns)
+
+    def build(self, rows: Iterable[int], fields: tuple[str, ...] | None = None, **extra) -> list[dict]:
+        """
+        :param rows: righe del catalogo, nell'ordine della risposta
+        :param fields: campi statici da includere (None = tutti)
+        :param extra: campi per richiesta, un valore per riga (sempre inclusi)
+        :return: lista di dict pronta per la risposta JSON
+        """
+        rows = rows.tolist() if isinstance(rows, np.ndarray) else list(rows)
+        columns = {name: _plain(values) for name, values in extra.items()}
+
+        out = []
+        for i, r in enumerate(rows):
+            rec = self.records[r]
+            if fields is None:
+                item = dict(rec)
+            else:
+                item = {f: rec[f] for f in fields if f in rec}
+            for name, values in columns.items():
+                item[name] = values[i]
+            out.append(item)
+        return out
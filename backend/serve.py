@@ -0,0 +1,144 @@
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+import config
+
+# un worker che termina entro questi secondi dall'avvio non viene riavviato
+# (errore di configurazione, non un crash occasionale)
+MIN_WORKER_UPTIME = 5.0
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """
+    Socket in ascolto aperto dal padre ed ereditato dai worker: il kernel
+    distribuisce le connessioni tra i processi che fanno accept.
+    """
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    # proto esplicito: asyncio imposta TCP_NODELAY sulle connessioni accettate solo
+    # per socket IPPROTO_TCP (con proto 0 le risposte keep-alive subiscono il ritardo di Nagle)
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app_module, sock: socket.socket, log_level: str):
+    """
+    Corpo di un worker dopo il fork: event loop e server uvicorn propri,
+    catalogo e artefatti già in memoria (ereditati dal padre).
+    """
+    # gli oggetti del padre restano nella generazione permanente (gc.freeze):
+    # il GC del worker non li visita e non ne sporca le pagine
+    gc.enable()
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    server = uvicorn.Server(uvicorn.Config(app_module.app, log_level=log_level))
+    server.run(sockets=[sock])
+    # os._exit salta gli handler atexit: salvataggi in attesa (utenti, righe materializzate) scritti qui
+    app_module.USERS.flush()
+    if app_module.RECS_TABLE is not None:
+        app_module.RECS_TABLE.flush()
+
+
+def serve(host: str, port: int, workers: int, log_level: str = "info"):
+    """
+    Avvio multi-processo: il padre carica una sola volta catalogo, record JSON,
+    vicini (mmap) e indice ANN importando main, poi crea `workers` figli con fork.
+
+    Gli array NumPy e i file in mmap restano pagine condivise copy-on-write tra
+    tutti i processi, quindi la memoria non cresce di una copia per worker.
+    Un worker terminato in modo anomalo viene ricreato con un nuovo fork.
+    """
+    # niente GC durante il caricamento e fino al fork (vedi gc.freeze)
+    gc.disable()
+    import main as app_module
+    sock = bind_socket(host, port)
+    gc.freeze()
+
+    children: dict[int, float] = {}
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_worker(app_module, sock, log_level)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"[serve] pid {os.getpid()}: {workers} worker su http://{host}:{port}", flush=True)
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        print(f"[serve] worker {pid} terminato (codice {code})", flush=True)
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            print("[serve] worker terminato subito dopo l'avvio: arresto", flush=True)
+            stop(None, None)
+        else:
+            spawn()
+
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Avvio dell'API con più worker che condividono catalogo e artefatti.")
+    parser.add_argument("--host", default=config.SERVER_HOST)
+    parser.add_argument("--port", type=int, default=config.SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=config.SERVER_WORKERS)
+    parser.add_argument("--users-backend", choices=["json", "sqlite"], default=config.USERS_BACKEND,
+                        help="repository utenti (sovrascrive USERS_BACKEND di config.py)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if args.workers < 1:
+        parser.error("--workers deve essere almeno 1")
+    if args.workers > 1 and args.users_backend == "json":
+        parser.error("con più worker serve il repository utenti SQLite "
+                     "(--users-backend sqlite, dopo migrate_users.py)")
+    # letto da main all'import, che avviene dopo
+    config.USERS_BACKEND = args.users_backend
+
+    serve(args.host, args.port, args.workers, args.log_level)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
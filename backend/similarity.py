@@ -0,0 +1,156 @@
+from pathlib import Path
+
+import numpy as np
+
+from catalog import top_k_rows
+
+
+def normalize_rows(embeddings: np.ndarray) -> np.ndarray:
+    """
+    Centra e normalizza ogni riga: il prodotto scalare tra due righe è la loro correlazione di Pearson.
+
+    Le righe a varianza nulla diventano vettori nulli (correlazione 0 con tutto),
+    come le righe NaN di `np.corrcoef` dopo `nan_to_num`.
+
+    :param embeddings: matrice (film, componenti)
+    :return: matrice float64 della stessa forma
+    """
+    z = np.asarray(embeddings, dtype=np.float64)
+    z = z - z.mean(axis=1, keepdims=True)
+    norms = np.linalg.norm(z, axis=1, keepdims=True)
+    return np.divide(z, norms, out=np.zeros_like(z), where=norms > 0)
+
+
+def top_k_neighbors(embeddings: np.ndarray,
+                    k: int,
+                    block_rows: int = 1024,
+                    dtype: str | np.dtype = np.float32,
+                    rows: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Primi k vicini per correlazione di ogni film, calcolati a blocchi di righe.
+
+    La matrice di correlazione completa (N x N) non viene mai materializzata:
+    per ogni blocco si calcola `block_rows x N`, si esclude il film stesso e si
+    tengono i k valori più alti (pareggi in ordine di indice). L'ordine è
+    deciso in float64, la precisione ridotta riguarda solo i punteggi salvati.
+
+    :param embeddings: matrice (film, componenti), ad es. l'output della SVD
+    :param k: vicini per film (al più N - 1)
+    :param block_rows: righe per blocco (memoria di picco ~ block_rows * N * 8 byte)
+    :param dtype: tipo dei punteggi restituiti (float32, float16 o float64)
+    :param rows: se indicato, calcola solo i vicini di questi film (uno per riga del risultato)
+    :return: (indici int32 (N, k), correlazioni (N, k)) in ordine decrescente
+    """
+    z = normalize_rows(embeddings)
+    n = z.shape[0]
+    k = max(0, min(int(k), n - 1))
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.intp)
+
+    neighbors = np.empty((rows.size, k), dtype=np.int32)
+    scores = np.empty((rows.size, k), dtype=dtype)
+    for start in range(0, rows.size, block_rows):
+        query = rows[start:start + block_rows]
+        block = z[query] @ z.T
+        block[np.arange(query.size), query] = -np.inf
+
+        idx = top_k_rows(block, k)
+        neighbors[start:start + query.size] = idx
+        scores[start:start + query.size] = np.take_along_axis(block, idx, axis=1)
+    return neighbors, scores
+
+
+def refresh_neighbors(embeddings: np.ndarray,
+                      neighbors: np.ndarray,
+                      scores: np.ndarray,
+                      changed: np.ndarray,
+                      block_rows: int = 1024) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Aggiorna le liste di vicini dopo che sono cambiati (o sono stati aggiunti in coda) alcuni film.
+
+    Il risultato coincide con `top_k_neighbors` sui nuovi embedding, pareggi compresi
+    (in ordine di indice), salvo differenze di arrotondamento tra correlazioni che
+    differiscono di pochi ulp; si ricalcola da zero solo chi serve:
+    - i film cambiati e quelli che avevano un film cambiato tra i vicini (la lista
+      può perdere un elemento, e il sostituto non è tra quelli salvati);
+    - per tutti gli altri i vicini salvati restano validi (punteggi invariati) e
+      basta confrontarli con i soli film cambiati.
+
+    :param embeddings: nuovi embedding (N, componenti), con gli eventuali film nuovi in coda
+    :param neighbors: vicini salvati (N_old, k), N_old <= N
+    :param scores: punteggi salvati (N_old, k)
+    :param changed: righe dei film cambiati o nuovi
+    :param block_rows: righe per blocco
+    :return: (vicini (N, k), punteggi (N, k)) aggiornati
+    """
+    z = normalize_rows(embeddings)
+    n = z.shape[0]
+    n_old, k = neighbors.shape
+    changed = np.unique(np.asarray(changed, dtype=np.intp))
+
+    is_changed = np.zeros(n, dtype=bool)
+    is_changed[changed] = True
+    stale = is_changed.copy()
+    stale[:n_old] |= is_changed[neighbors].any(axis=1)
+
+    out_neighbors = np.empty((n, k), dtype=np.int32)
+    out_scores = np.empty((n, k), dtype=scores.dtype)
+    out_neighbors[:n_old] = neighbors
+    out_scores[:n_old] = scores
+
+    full = np.flatnonzero(stale)
+    out_neighbors[full], out_scores[full] = top_k_neighbors(
+        embeddings, k, block_rows=block_rows, dtype=scores.dtype, rows=full
+    )
+
+    # righe non toccate: vicini salvati (rivalutati in float64) + film cambiati
+    merge = np.flatnonzero(~stale)
+    for start in range(0, merge.size, block_rows):
+        query = merge[start:start + block_rows]
+        kept = out_neighbors[query]
+        kept_scores = np.einsum("md,mkd->mk", z[query], z[kept])
+        cand = np.concatenate([kept, np.broadcast_to(changed, (query.size, changed.size))], axis=1)
+        cand_scores = np.concatenate([kept_scores, z[query] @ z[changed].T], axis=1)
+        # candidati in ordine di indice: a parità di punteggio vince il film con
+        # indice minore, come in `top_k_neighbors`
+        order = np.argsort(cand, axis=1, kind="stable")
+        cand = np.take_along_axis(cand, order, axis=1)
+        cand_scores = np.take_along_axis(cand_scores, order, axis=1)
+
+        pick = top_k_rows(cand_scores, k)
+        out_neighbors[query] = np.take_along_axis(cand, pick, axis=1)
+        out_scores[query] = np.take_along_axis(cand_scores, pick, axis=1)
+    return out_neighbors, out_scores
+
+
+class NeighborIndex:
+    """
+    Liste dei k vicini più simili per film (righe di movies_ids.npy + correlazioni).
+    """
+
+    def __init__(self, neighbors: np.ndarray, scores: np.ndarray):
+        self.neighbors = neighbors
+        self.scores = scores
+        self.k = neighbors.shape[1]
+
+    @classmethod
+    def load(cls, neighbors_file: Path, scores_file: Path, mmap: bool = True) -> "NeighborIndex":
+        """
+        Apre gli array salvati da precompute.py.
+
+        Con `mmap` i file sono mappati in sola lettura: nessuna copia all'avvio
+        e pagine condivise tramite page cache tra i worker uvicorn.
+        """
+        mode = "r" if mmap else None
+        return cls(np.load(neighbors_file, mmap_mode=mode), np.load(scores_file, mmap_mode=mode))
+
+    def similar(self, row: int, top_k: int) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Primi top_k vicini (solo correlazione positiva) del film alla riga `row`.
+
+        :return: (indici, correlazioni), al più min(top_k, k) elementi
+        """
+        idx = self.neighbors[row, :max(0, top_k)]
+        sc = self.scores[row, :max(0, top_k)]
+        keep = sc > 0
+        return idx[keep], sc[keep]
+
@@ -0,0 +1,185 @@
+from typing import TYPE_CHECKING, Tuple
+
+import argparse
+import multiprocessing as mp
+import os
+import time
+
+import numpy as np
+import config
+from catalog import top_k_rows
+
+if TYPE_CHECKING:
+    # solo per le annotazioni: a runtime scipy è importato dalle funzioni del job
+    from scipy.sparse import csr_matrix
+
+# matrici del job condivise con i processi del pool (impostate da _init_worker)
+_shared: dict = {}
+
+
+def centered_matrices(R: "csr_matrix") -> Tuple["csr_matrix", "csr_matrix", np.ndarray]:
+    """
+    Rating centrati sulla media di ogni utente e righe normalizzate.
+
+    Il prodotto scalare tra due righe normalizzate è il coseno aggiustato
+    (rating centrati) tra i due utenti; le celle non votate restano vuote.
+
+    :param R: matrice CSR (utenti, film) dei rating
+    :return: (rating centrati, righe centrate e normalizzate, media per utente)
+    """
+    from scipy.sparse import diags
+
+    counts = np.diff(R.indptr)
+    means = np.divide(np.asarray(R.sum(axis=1)).ravel(), counts,
+                      out=np.zeros(R.shape[0]), where=counts > 0)
+    C = R.astype(np.float64, copy=True)
+    C.data -= np.repeat(means, counts)
+    norms = np.sqrt(np.asarray(C.multiply(C).sum(axis=1)).ravel())
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return C, (diags(inv) @ C).tocsr(), means
+
+
+def _init_worker(R: "csr_matrix", C: "csr_matrix", Z: "csr_matrix", means: np.ndarray):
+    rated = R.copy()
+    rated.data[:] = 1.0
+    _shared.update(R=R, C=C, Z=Z, ZT=Z.T.tocsc(), means=means, rated=rated)
+
+
+def _chunk(bounds: Tuple[int, int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Candidati di un blocco di utenti [start, stop).
+
+    1. similarità con tutti gli utenti (blocco denso righe x utenti), solo i
+       primi USER_CF_NEIGHBORS vicini con similarità positiva;
+    2. rating previsto = media utente + media pesata degli scarti dei vicini
+       che hanno votato il film (almeno USER_CF_MIN_SUPPORT vicini);
+    3. film già votati esclusi, primi USER_CF_TOP_N per rating previsto.
+    """
+    from scipy.sparse import csr_matrix
+
+    R, C, Z, rated = _shared["R"], _shared["C"], _shared["Z"], _shared["rated"]
+    start, stop = bounds
+    n = stop - start
+    sim = (Z[start:stop] @ _shared["ZT"]).toarray()
+    sim[np.arange(n), np.arange(start, stop)] = -np.inf
+
+    k = min(config.USER_CF_NEIGHBORS, sim.shape[1] - 1)
+    cols = top_k_rows(sim, k)
+    vals = np.take_along_axis(sim, cols, axis=1)
+    keep = vals > 0
+    S = csr_matrix((vals[keep], (np.nonzero(keep)[0], cols[keep])), shape=sim.shape)
+
+    num = (S @ C).toarray()
+    den = (S @ rated).toarray()
+    S.data[:] = 1.0
+    support = (S @ rated).toarray()
+
+    ok = support >= config.USER_CF_MIN_SUPPORT
+    pred = np.full(num.shape, -np.inf)
+    np.divide(num, den, out=pred, where=ok)
+    pred[ok] += np.broadcast_to(_shared["means"][start:stop, None], pred.shape)[ok]
+    own = R[start:stop]
+    pred[np.repeat(np.arange(n), np.diff(own.indptr)), own.indices] = -np.inf
+
+    top = top_k_rows(pred, config.USER_CF_TOP_N)
+    scores = np.take_along_axis(pred, top, axis=1)
+    top = top.astype(np.int32)
+    top[~np.isfinite(scores)] = -1
+    return top, np.where(np.isfinite(scores), scores, np.nan).astype(np.float32)
+
+
+def user_candidates(user_ids: np.ndarray,
+                    movie_ids: np.ndarray,
+                    ratings: np.ndarray,
+                    catalog_ids: np.ndarray | None = None,
+                    workers: int = 0,
+                    chunk_rows: int = config.USER_CF_CHUNK_ROWS):
+    """
+    Candidati user-based per ogni utente dei rating, calcolati a blocchi di utenti
+    su più processi.
+
+    :param workers: processi del pool (0 = tutti i core, 1 = nel processo corrente)
+    :return: (user_id ordinati int32, movie_id candidati (utenti, USER_CF_TOP_N) int32
+             con -1 = posto vuoto, rating previsti float32 con NaN = posto vuoto)
+    """
+    # scipy e sklearn (via precompute) servono solo al job: il server importa
+    # questo modulo per UserCandidates e non li richiede
+    from precompute import utility_matrix
+
+    X, item_ids, users = utility_matrix(user_ids, movie_ids, ratings, catalog_ids=catalog_ids)
+    R = X.T.tocsr()
+    C, Z, means = centered_matrices(R)
+
+    bounds = [(s, min(s + chunk_rows, R.shape[0])) for s in range(0, R.shape[0], chunk_rows)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(R, C, Z, means)
+        parts = [_chunk(b) for b in bounds]
+    else:
+        with mp.Pool(workers, initializer=_init_worker, initargs=(R, C, Z, means)) as pool:
+            parts = pool.map(_chunk, bounds)
+
+    cols = np.concatenate([p[0] for p in parts])
+    scores = np.concatenate([p[1] for p in parts])
+    candidates = np.where(cols >= 0, item_ids[np.maximum(cols, 0)], -1).astype(np.int32)
+    return users, candidates, scores
+
+
+class UserCandidates:
+    """
+    Candidati user-based precalcolati, con lookup O(1) user_id -> riga.
+
+    :param user_ids: user_id di ogni riga
+    :param movie_ids: matrice (utenti, N) dei movie_id candidati, -1 = posto vuoto
+    :param scores: matrice (utenti, N) dei rating previsti
+    """
+
+    def __init__(self, user_ids: np.ndarray, movie_ids: np.ndarray, scores: np.ndarray):
+        self.movie_ids = movie_ids
+        self.scores = scores
+        self.row_of_user = np.full(int(user_ids.max(initial=0)) + 1, -1, dtype=np.int32)
+        self.row_of_user[user_ids] = np.arange(user_ids.size, dtype=np.int32)
+
+    @classmethod
+    def load(cls, path=config.USER_CF_FILE) -> "UserCandidates":
+        with np.load(path) as f:
+            return cls(f["user_ids"], f["movie_ids"], f["scores"])
+
+    def get(self, user_id: int, top_k: int) -> Tuple[np.ndarray, np.ndarray] | None:
+        """
+        Primi `top_k` candidati (già senza i film votati dall'utente), o None se l'utente non c'è.
+        """
+        if not 0 <= user_id < self.row_of_user.size or self.row_of_user[user_id] < 0:
+            return None
+        row = self.row_of_user[user_id]
+        ids = self.movie_ids[row, :max(top_k, 0)]
+        valid = ids >= 0
+        return ids[valid], self.scores[row, :max(top_k, 0)][valid]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Candidati collaborative filtering user-user da ratings.csv.")
+    parser.add_argument("--workers", type=int, default=config.USER_CF_WORKERS,
+                        help="processi (0 = tutti i core)")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from precompute import load_ratings, save_atomic
+
+    t0 = time.perf_counter()
+    ratings = load_ratings()
+    catalog_ids = pd.read_csv(config.MOVIES_FILE, usecols=["movie_id"])["movie_id"].to_numpy()
+    users, candidates, scores = user_candidates(
+        ratings["user_id"].to_numpy(), ratings["movie_id"].to_numpy(), ratings["rating"].to_numpy(),
+        catalog_ids=catalog_ids, workers=args.workers,
+    )
+    save_atomic(config.USER_CF_FILE,
+                lambda p: np.savez(p, user_ids=users, movie_ids=candidates, scores=scores))
+    filled = (candidates >= 0).sum(axis=1)
+    print(f"Salvato {config.USER_CF_FILE}: {users.size} utenti, candidati per utente "
+          f"min {filled.min(initial=0)} / medi {filled.mean() if filled.size else 0:.1f}, "
+          f"{time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+from pathlib import Path
+from typing import Dict, Any, Optional, Callable
+
+import atexit
+import bisect
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+
+import config
+
+
+class JsonUserStore:
+    """
+    Repository degli utenti tenuto in memoria e sincronizzato con users.json.
+
+    - le letture non rileggono il file: basta un `os.stat` per accorgersi se è
+      cambiato (mtime/size) e solo in quel caso viene ricaricato;
+    - le scritture aggiornano la memoria e vengono salvate in differita
+      (write-behind): più modifiche ravvicinate diventano un'unica scrittura,
+      fatta su un file temporaneo e poi rinominata in modo atomico;
+    - le preferenze sono salvate già normalizzate (`normalize`).
+
+    I dizionari restituiti sono quelli interni: vanno trattati in sola lettura.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 normalize: Optional[Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]] = None,
+                 write_delay: float = config.USERS_WRITE_DELAY):
+        self.path = Path(path)
+        self.normalize = normalize or (lambda p: dict(p or {}))
+        self.write_delay = write_delay
+
+        self._lock = threading.RLock()
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._ids: Optional[list[str]] = None
+        self._stat: Optional[tuple[int, int]] = None
+        self._dirty = False
+        self._timer: Optional[threading.Timer] = None
+
+        self._reload()
+        atexit.register(self.flush)
+
+    # ---- Sync col file ----
+    def _file_stat(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload(self):
+        stat = self._file_stat()
+        users = {}
+        if stat is not None:
+            with open(self.path, "r", encoding="utf-8") as f:
+                users = json.load(f)
+        self._users = {uid: self.normalize(p) for uid, p in users.items()}
+        self._ids = None
+        self._stat = stat
+
+    def _refresh(self):
+        # con scritture in attesa la copia in memoria è la più recente
+        if not self._dirty and self._file_stat() != self._stat:
+            self._reload()
+
+    # ---- Letture ----
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return self._users
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._refresh()
+            return self._users.get(user_id)
+
+    def ids(self) -> list[str]:
+        """
+        Id utente ordinati (lista in cache, ricalcolata solo dopo una modifica).
+        """
+        with self._lock:
+            self._refresh()
+            if self._ids is None:
+                self._ids = sorted(self._users)
+            return self._ids
+
+    def get_many(self, user_ids: list[str]) -> Dict[str, Dict[str, Any]]:
+        users = self.all()
+        return {uid: users[uid] for uid in user_ids if uid in users}
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> tuple[list[str], Optional[str]]:
+        """
+        Pagina di id ordinati successivi a `cursor`; restituisce anche il cursore seguente.
+        """
+        ids = self.ids()
+        start = bisect.bisect_right(ids, cursor) if cursor is not None else 0
+        chunk = ids[start:start + limit]
+        next_cursor = chunk[-1] if chunk and start + limit < len(ids) else None
+        return chunk, next_cursor
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    # ---- Scritture ----
+    def set(self, user_id: str, prefs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Crea o aggiorna le preferenze di un utente; restituisce quelle normalizzate.
+        """
+        normalized = self.normalize(prefs)
+        with self._lock:
+            self._refresh()
+            if user_id not in self._users:
+                self._ids = None
+            # copy-on-write: i dizionari già restituiti da all() non cambiano sotto i piedi
+            self._users = {**self._users, user_id: normalized}
+            self._schedule_write()
+        return normalized
+
+    def create(self, user_id: str, prefs: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Crea un nuovo utente; restituisce None se esiste già.
+        """
+        with self._lock:
+            self._refresh()
+            if user_id in self._users:
+                return None
+            return self.set(user_id, prefs)
+
+    def replace_all(self, users: Dict[str, Any]):
+        """
+        Sostituisce l'intero insieme di utenti.
+        """
+        with self._lock:
+            self._users = {uid: self.normalize(p) for uid, p in users.items()}
+            self._ids = None
+            self._schedule_write()
+
+    def _schedule_write(self):
+        self._dirty = True
+        if self.write_delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(self.write_delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        """
+        Scrive subito su disco le modifiche in attesa (rename atomico).
+        """
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=self.path.name, suffix=".tmp")
+            try:
+                if self.path.exists():
+                    os.chmod(tmp, os.stat(self.path).st_mode & 0o777)
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(self._users, f, indent=2, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+                raise
+
+            self._stat = self._file_stat()
+            self._dirty = False
+
+
+class SqliteUserStore:
+    """
+    Repository degli utenti su SQLite (WAL), con la stessa interfaccia di JsonUserStore.
+
+    Una riga per utente con le preferenze normalizzate in JSON: lookup puntuali
+    sulla chiave primaria, upsert transazionali (sicuri anche con più worker
+    uvicorn) e paginazione a cursore sugli id.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 normalize: Optional[Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]] = None):
+        self.path = Path(path)
+        self.normalize = normalize or (lambda p: dict(p or {}))
+        self._local = threading.local()
+
+        # connessione usa e getta: il thread che crea il repository (es. il padre
+        # di serve.py prima del fork) non deve lasciarne una aperta ai figli
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS users ("
+                    " user_id TEXT PRIMARY KEY,"
+                    " preferences TEXT NOT NULL"
+                    ") WITHOUT ROWID"
+                )
+        finally:
+            conn.close()
+
+    def _conn(self) -> sqlite3.Connection:
+        # una connessione per thread (gli endpoint sync girano nel threadpool)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---- Letture ----
+    def all(self) -> Dict[str, Dict[str, Any]]:
+        rows = self._conn().execute("SELECT user_id, preferences FROM users ORDER BY user_id")
+        return {uid: json.loads(p) for uid, p in rows}
+
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT preferences FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, user_ids: list[str]) -> Dict[str, Dict[str, Any]]:
+        out = {}
+        for uid in user_ids:
+            p = self.get(uid)
+            if p is not None:
+                out[uid] = p
+        return out
+
+    def ids(self) -> list[str]:
+        rows = self._conn().execute("SELECT user_id FROM users ORDER BY user_id")
+        return [uid for (uid,) in rows]
+
+    def page(self, limit: int, cursor: Optional[str] = None) -> tuple[list[str], Optional[str]]:
+        """
+        Pagina di id ordinati successivi a `cursor`; restituisce anche il cursore seguente.
+        """
+        rows = self._conn().execute(
+            "SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+            (cursor if cursor is not None else "", limit + 1),
+        ).fetchall()
+        chunk = [uid for (uid,) in rows[:limit]]
+        next_cursor = chunk[-1] if len(rows) > limit and chunk else None
+        return chunk, next_cursor
+
+    def __contains__(self, user_id: str) -> bool:
+        return self.get(user_id) is not None
+
+    # ---- Scritture ----
+    def set(self, user_id: str, prefs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Crea o aggiorna le preferenze di un utente; restituisce quelle normalizzate.
+        """
+        normalized = self.normalize(prefs)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO users (user_id, preferences) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET preferences = excluded.preferences",
+                (user_id, json.dumps(normalized, ensure_ascii=False)),
+            )
+        return normalized
+
+    def create(self, user_id: str, prefs: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Crea un nuovo utente; restituisce None se esiste già.
+        """
+        normalized = self.normalize(prefs)
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, preferences) VALUES (?, ?)",
+                (user_id, json.dumps(normalized, ensure_ascii=False)),
+            )
+        return normalized if cur.rowcount == 1 else None
+
+    def replace_all(self, users: Dict[str, Any]):
+        """
+        Sostituisce l'intero insieme di utenti in un'unica transazione.
+        """
+        rows = [(uid, json.dumps(self.normalize(p), ensure_ascii=False)) for uid, p in users.items()]
+        with self._conn() as conn:
+            conn.execute("DELETE FROM users")
+            conn.executemany("INSERT INTO users (user_id, preferences) VALUES (?, ?)", rows)
+
+    def flush(self):
+        # ogni scrittura è già committata
+        pass
+
+
+def open_user_store(normalize: Optional[Callable[[Optional[Dict[str, Any]]], Dict[str, Any]]] = None):
+    """
+    Repository utenti scelto da config.USERS_BACKEND ("json" o "sqlite").
+    """
+    if config.USERS_BACKEND == "sqlite":
+        return SqliteUserStore(config.USERS_DB_FILE, normalize=normalize)
+    if config.USERS_BACKEND == "json":
+        return JsonUserStore(config.USERS_FILE, normalize=normalize)
+    raise ValueError(f"USERS_BACKEND non supportato: {config.USERS_BACKEND}")
@@ -1,18 +1,48 @@
 # -*- coding: utf-8 -*-
 import requests
+import argparse
+import asyncio
+import gc
 import itertools
 import json
 import math
+import multiprocessing as mp
 import os
 import random
+import sys
+import time
 from collections import defaultdict
+from fractions import Fraction
 from statistics import mean
 
+import httpx
+
+import numpy as np
+
+# bitmask dei generi condivise con il backend
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+from genres import GENRES, KNOWN_GENRES_MASK, genre_mask, record_mask, mean_pairwise_jaccard
+
 BASE = "http://127.0.0.1:8058"
 CATALOG_SIZE = 1682
 TOP_K_DEFAULT = 10
 BOOTSTRAP_B = 1000
 BOOTSTRAP_SEED = 12345
+# indici di ricampionamento per blocco e celle per blocco del prodotto di Gram (personalization)
+BOOTSTRAP_MAX_CELLS = 4_000_000
+JACCARD_MAX_CELLS = 8_000_000
+# modalità async: richieste contemporanee, tentativi e attesa base (raddoppia a ogni tentativo)
+CONCURRENCY_DEFAULT = 32
+RETRIES_DEFAULT = 3
+BACKOFF_BASE = 0.2
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# modalità inprocess: utenti per task del pool, file delle righe per utente, seed dei profili sintetici
+INPROC_CHUNK = 256
+PER_USER_FILE_DEFAULT = "results_per_user.jsonl"
+SYNTHETIC_SEED = 2024
+
+# latenze (secondi) per endpoint, riportate in results.json
+LATENCIES = defaultdict(list)
 
 # ========== Helpers ==========
 def safe_float(x, default=0.0):
@@ -27,58 +57,110 @@ def get_movie_id(rec):
     mid = rec.get("movie_id")
     return None if mid is None else str(mid)
 
-def _get_json(url, params=None):
+def _timed_get(endpoint, url, params=None):
+    t0 = time.perf_counter()
     r = requests.get(url, params=params, timeout=30)
+    LATENCIES[endpoint].append(time.perf_counter() - t0)
+    return r
+
+def _get_json(url, params=None, endpoint="other"):
+    r = _timed_get(endpoint, url, params)
     if r.status_code == 404:
         raise FileNotFoundError(f"404 Not Found: {url}")
     r.raise_for_status()
     return r.json()
 
 def fetch_user_ids():
-    r = requests.get(f"{BASE}/users")
+    r = _timed_get("users", f"{BASE}/users")
     r.raise_for_status()
     return r.json().get("users", [])
 
 def fetch_user_prefs(user_id):
-    pr = requests.get(f"{BASE}/users/{user_id}")
+    pr = _timed_get("preferences", f"{BASE}/users/{user_id}")
     if pr.status_code == 200:
         return pr.json().get("preferences", {}) or {}
     return {}
 
-# Torna sia risultati che meta (per bandit: diagnostica)
-def fetch_recs(user_id, method="constraint", **kwargs):
+def _recs_params(method, **kwargs):
     if method == "constraint":
-        url = f"{BASE}/recommendations/{user_id}"
-        params = {"top_k": kwargs.get("top_k", TOP_K_DEFAULT)}
-        resp = _get_json(url, params)
+        return {"top_k": kwargs.get("top_k", TOP_K_DEFAULT)}
+    if method == "bandit":
         return {
-            "results": resp.get("results", []),
-            "meta": {"status": resp.get("status", "ok"), "epsilon": None, "diagnostics": None}
-        }
-    elif method == "bandit":
-        url1 = f"{BASE}/recommendations_bandit/{user_id}"
-        params = {
             "top_k": kwargs.get("top_k", TOP_K_DEFAULT),
             "epsilon": kwargs.get("epsilon", 0.35),
             "candidate_pool": kwargs.get("candidate_pool", 160),
             "explore_extra": kwargs.get("explore_extra", 400),
             "seed": kwargs.get("seed", 42),
         }
-        try:
-            resp = _get_json(url1, params)
-        except FileNotFoundError:
-            url2 = f"{BASE}/bandit/{user_id}"
-            resp = _get_json(url2, params)
+    raise ValueError(f"Metodo non supportato: {method}")
+
+def _recs_payload(method, resp):
+    if method == "constraint":
         return {
             "results": resp.get("results", []),
-            "meta": {
-                "status": resp.get("status", "ok"),
-                "epsilon": resp.get("epsilon"),
-                "diagnostics": resp.get("diagnostics", {})
-            }
+            "meta": {"status": resp.get("status", "ok"), "epsilon": None, "diagnostics": None}
         }
+    return {
+        "results": resp.get("results", []),
+        "meta": {
+            "status": resp.get("status", "ok"),
+            "epsilon": resp.get("epsilon"),
+            "diagnostics": resp.get("diagnostics", {})
+        }
+    }
+
+# Torna sia risultati che meta (per bandit: diagnostica)
+def fetch_recs(user_id, method="constraint", **kwargs):
+    params = _recs_params(method, **kwargs)
+    if method == "constraint":
+        resp = _get_json(f"{BASE}/recommendations/{user_id}", params, endpoint="constraint")
+    else:
+        try:
+            resp = _get_json(f"{BASE}/recommendations_bandit/{user_id}", params, endpoint="bandit")
+        except FileNotFoundError:
+            resp = _get_json(f"{BASE}/bandit/{user_id}", params, endpoint="bandit")
+    return _recs_payload(method, resp)
+
+# ========== Client async (pool di connessioni keep-alive) ==========
+async def _aget_json(client, sem, endpoint, path, params=None, retries=RETRIES_DEFAULT):
+    """
+    GET con al più `sem` richieste in volo, ritentata con backoff esponenziale
+    (più jitter) su errori di rete e risposte 429/5xx.
+    """
+    for attempt in range(retries + 1):
+        try:
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.get(path, params=params)
+                LATENCIES[endpoint].append(time.perf_counter() - t0)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        else:
+            if r.status_code not in RETRY_STATUS or attempt == retries:
+                if r.status_code == 404:
+                    raise FileNotFoundError(f"404 Not Found: {path}")
+                r.raise_for_status()
+                return r.json()
+        await asyncio.sleep(BACKOFF_BASE * 2 ** attempt * (0.5 + random.random()))
+
+async def fetch_user_prefs_async(client, sem, user_id, retries=RETRIES_DEFAULT):
+    try:
+        resp = await _aget_json(client, sem, "preferences", f"/users/{user_id}", retries=retries)
+    except (FileNotFoundError, httpx.HTTPStatusError):
+        return {}
+    return resp.get("preferences", {}) or {}
+
+async def fetch_recs_async(client, sem, user_id, method="constraint", retries=RETRIES_DEFAULT, **kwargs):
+    params = _recs_params(method, **kwargs)
+    if method == "constraint":
+        resp = await _aget_json(client, sem, "constraint", f"/recommendations/{user_id}", params, retries)
     else:
-        raise ValueError(f"Metodo non supportato: {method}")
+        try:
+            resp = await _aget_json(client, sem, "bandit", f"/recommendations_bandit/{user_id}", params, retries)
+        except FileNotFoundError:
+            resp = await _aget_json(client, sem, "bandit", f"/bandit/{user_id}", params, retries)
+    return _recs_payload(method, resp)
 
 # ========== Ground truth (opzionale) ==========
 # relevant.json (facoltativo):
@@ -92,12 +174,6 @@ def load_relevant_local():
     return {}
 
 # ========== Metriche ==========
-def is_genre_flag(k, v):
-    return (
-        k not in ("unknown", "movie_id", "score", "novel", "pick_strategy", "novelty_reason", "movie_title") and
-        ((v == 1) or (v is True) or (isinstance(v, str) and v == "1"))
-    )
-
 def accuracy(results):
     if not results: return 0.0
     return sum(1 for r in results if safe_float(r.get("score"), 0.0) >= 2.0) / len(results)
@@ -106,52 +182,145 @@ def partial_accuracy(results):
     if not results: return 0.0
     return sum(1 for r in results if safe_float(r.get("score"), 0.0) >= 1.0) / len(results)
 
+def genre_masks(results):
+    return np.array([record_mask(r) for r in results], dtype=np.uint32) & KNOWN_GENRES_MASK
+
 def diversity_ild(results):
-    G = []
-    for r in results:
-        genres = {k for k, v in r.items() if is_genre_flag(k, v)}
-        if genres: G.append(genres)
+    G = genre_masks(results)
+    G = G[G != 0]
     if len(G) < 2: return 0.0
-    pairs = list(itertools.combinations(G, 2))
-    if not pairs: return 0.0
-    def jacc(a, b):
-        inter = len(a & b); union = len(a | b)
-        return inter / (union or 1)
-    sims = [jacc(a, b) for a, b in pairs]
-    return 1.0 - (sum(sims) / len(sims))
+    return 1.0 - mean_pairwise_jaccard(G)
 
 def serendipity(results, prefs):
     if not results: return 0.0
-    desiderati = set(prefs.get("generi_desiderati", []) or [])
+    desiderati = genre_mask(prefs.get("generi_desiderati", []) or [])
     if not desiderati: return 0.0
-    novel = 0
-    for r in results:
-        genres = {k for k, v in r.items() if is_genre_flag(k, v)}
-        if genres.isdisjoint(desiderati):
-            novel += 1
+    novel = int(np.count_nonzero((genre_masks(results) & desiderati) == 0))
     return novel / len(results)
 
-def coverage(all_results):
-    rec_ids = {get_movie_id(r) for rs in all_results for r in rs if get_movie_id(r) is not None}
-    return len(rec_ids) / CATALOG_SIZE
-
-def personalization_jaccard(all_users_results):
-    if len(all_users_results) < 2: return 0.0
-    sims = []
-    for a, b in itertools.combinations(all_users_results, 2):
-        setA = {get_movie_id(r) for r in a if get_movie_id(r) is not None}
-        setB = {get_movie_id(r) for r in b if get_movie_id(r) is not None}
-        inter = len(setA & setB); union = len(setA | setB)
-        sims.append(inter / (union or 1))
-    return 1 - (sum(sims) / len(sims))
+def result_ids(results):
+    return [mid for mid in (get_movie_id(r) for r in results) if mid is not None]
+
+def incidence_matrix(id_lists):
+    """
+    Matrice sparsa (utenti, film raccomandati) con 1 se il film è nella lista
+    dell'utente (ripetizioni contate una volta): base di coverage e personalization.
+
+    :param id_lists: movie_id raccomandati a ogni utente
+    """
+    # scipy importato solo qui, per le metriche aggregate (requirements-jobs.txt)
+    from scipy.sparse import csr_matrix
+
+    lengths = np.fromiter((len(ids) for ids in id_lists), dtype=np.int64, count=len(id_lists))
+    flat = np.array([str(mid) for ids in id_lists for mid in ids], dtype=str)
+    # movie_id come stringhe, come get_movie_id (5 e "5" sono lo stesso film)
+    _, cols = np.unique(flat, return_inverse=True)
+    indptr = np.zeros(lengths.size + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr[1:])
+    X = csr_matrix((np.ones(cols.size, dtype=np.int32), cols.ravel(), indptr),
+                   shape=(lengths.size, int(cols.max(initial=-1)) + 1))
+    X.sum_duplicates()
+    X.data[:] = 1
+    return X
+
+def coverage(X):
+    # film raccomandati almeno una volta (colonne della matrice di incidenza)
+    return X.shape[1] / CATALOG_SIZE
+
+def _unique_lists(X):
+    # liste identiche (stessi film) una volta sola, con il numero di utenti che le condividono
+    bounds = zip(X.indptr[:-1].tolist(), X.indptr[1:].tolist())
+    keys = np.empty(X.shape[0], dtype=object)
+    keys[:] = [X.indices[a:b].tobytes() for a, b in bounds]
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    return X[first], counts
+
+def personalization_jaccard(X, max_cells=JACCARD_MAX_CELLS):
+    """
+    1 - Jaccard medio tra le liste di tutte le coppie di utenti.
+
+    Le intersezioni sono il prodotto di Gram X Xᵀ (interi), calcolato a blocchi
+    di righe (al più `max_cells` celle dense) e solo verso gli utenti successivi;
+    |A ∪ B| = |A| + |B| - |A ∩ B|. Le liste identiche sono raggruppate e le
+    coppie pesate con il numero di utenti che le condividono.
+
+    Si contano le coppie per (|A ∩ B|, |A ∪ B|) e la media è una frazione
+    esatta: nessun errore di somma in virgola mobile che sposti l'arrotondamento.
+
+    :param X: matrice di incidenza utenti x film (incidence_matrix)
+    """
+    n = X.shape[0]
+    if n < 2: return 0.0
+    L, weights = _unique_lists(X)
+    L = L.astype(np.int32)
+    LT = L.T
+    sizes = np.diff(L.indptr).astype(np.int32)
+    w = weights.astype(np.float64)
+    weighted = bool(weights.max() > 1)
+
+    # coppie per (intersezione, unione) in un istogramma con chiave
+    # intersezione * width + unione = intersezione * (width - 1) + |A| + |B|
+    width = 2 * int(sizes.max(initial=0)) + 1
+    pairs = np.zeros((width // 2 + 1) * width, dtype=np.int64)
+    # coppie di utenti con la stessa lista: Jaccard 1 (0 se la lista è vuota)
+    same = int(np.sum(weights * (weights - 1) // 2 * (sizes > 0)))
+    m = L.shape[0]
+    rows = max(1, max_cells // m)
+    for start in range(0, m, rows):
+        stop = min(start + rows, m)
+        key = (L[start:stop] @ LT[:, start:]).toarray()
+        key *= width - 1
+        key += sizes[start:stop, None]
+        key += sizes[None, start:]
+        # solo coppie (i, j) con j > i: le altre vanno nella chiave 0 (intersezione
+        # vuota), come le coppie disgiunte che hanno Jaccard 0 e non contano
+        key[:, :stop - start] = np.triu(key[:, :stop - start], 1)
+        if weighted:
+            # pesi interi: somme esatte in float64 finché restano sotto 2**53
+            cw = w[start:stop, None] * w[None, start:]
+            pairs += np.bincount(key.ravel(), weights=cw.ravel(), minlength=pairs.size).astype(np.int64)
+        else:
+            pairs += np.bincount(key.ravel(), minlength=pairs.size)
+
+    total = Fraction(same)
+    for key in np.flatnonzero(pairs[width:]).tolist():
+        i, u = divmod(key + width, width)
+        total += Fraction(int(pairs[key + width]) * i, u)
+    n_pairs = n * (n - 1) // 2
+    value = 1 - total / n_pairs
+    # la versione con i cicli somma le coppie in sequenza (sum), con un errore
+    # fino a ~n_pairs ulp: vicino a un …5 l'arrotondamento a 3 decimali può
+    # dipendere da quell'errore, e solo lì si rifà la stessa somma
+    scaled = value * 1000
+    if abs(scaled - math.floor(scaled) - Fraction(1, 2)) <= Fraction(n_pairs * 1000, 2 ** 52):
+        return _personalization_sequential(X, max_cells)
+    return float(value)
+
+def _personalization_sequential(X, max_cells=JACCARD_MAX_CELLS):
+    # stessa somma della versione con i cicli: Jaccard delle coppie nell'ordine di
+    # itertools.combinations, sommati uno dopo l'altro (np.add.accumulate è sequenziale)
+    n = X.shape[0]
+    X = X.astype(np.int32)
+    sizes = np.diff(X.indptr)
+    total = 0.0
+    rows = max(1, max_cells // n)
+    for start in range(0, n, rows):
+        stop = min(start + rows, n)
+        inter = (X[start:stop] @ X[start:].T).toarray()
+        for r in range(stop - start):
+            i = start + r
+            common = inter[r, r + 1:]
+            union = np.maximum(sizes[i] + sizes[i + 1:] - common, 1)
+            total = float(np.add.accumulate(np.concatenate(([total], common / union)))[-1])
+    return 1 - total / (n * (n - 1) / 2)
 
 # proxy di “rilevanza” se non c’è GT
 def proxy_relevance_from_prefs(rec, prefs):
-    desiderati = set(prefs.get("generi_desiderati", []) or [])
-    vietati = set(prefs.get("generi_vietati", []) or [])
-    genres = {k for k, v in rec.items() if is_genre_flag(k, v)}
-    if vietati and not genres.isdisjoint(vietati): return 0
-    if desiderati and genres.intersection(desiderati): return 1
+    desiderati = genre_mask(prefs.get("generi_desiderati", []) or [])
+    vietati = genre_mask(prefs.get("generi_vietati", []) or [])
+    genres = record_mask(rec) & KNOWN_GENRES_MASK
+    if genres & vietati: return 0
+    if genres & desiderati: return 1
     return 0
 
 def precision_at_k(results, relevant_ids=None, prefs=None, k=TOP_K_DEFAULT):
@@ -190,134 +359,445 @@ def ndcg_at_k(results, relevant_ids=None, prefs=None, k=TOP_K_DEFAULT):
         idcg += g if idx == 1 else g / math.log2(idx)
     return 0.0 if idcg == 0 else dcg / idcg
 
+def _python_random_state(seed):
+    # MT19937 inizializzato come random.Random(seed) (init_by_array sui blocchi da 32 bit di |seed|)
+    a = abs(int(seed))
+    key = [a & 0xFFFFFFFF]
+    while a >> 32:
+        a >>= 32
+        key.append(a & 0xFFFFFFFF)
+    return np.random.RandomState(key)
+
+def bootstrap_indices(n, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED, max_cells=BOOTSTRAP_MAX_CELLS):
+    """
+    Indici dei B ricampionamenti con reinserimento di n valori, a blocchi di righe
+    (al più `max_cells` indici per blocco).
+
+    Gli indici sono quelli di `random.Random(seed).randrange(n)` estratto B*n volte:
+    stesso flusso MT19937 e stesso scarto dei valori >= n su n.bit_length() bit,
+    quindi ricampionamenti identici alla versione con i cicli Python.
+    """
+    rs = _python_random_state(seed)
+    shift = 32 - n.bit_length()
+    rows = max(1, max_cells // n)
+    pending = np.empty(0, dtype=np.int64)
+    for start in range(0, B, rows):
+        need = min(rows, B - start) * n
+        while pending.size < need:
+            # parole in più per compensare gli scarti; quelle avanzate restano per il blocco seguente
+            draw = (need - pending.size) * (1 << (32 - shift)) // n + 64
+            r = (rs.randint(0, 1 << 32, size=draw, dtype=np.uint32) >> shift).astype(np.int64)
+            pending = np.concatenate([pending, r[r < n]])
+        yield pending[:need].reshape(-1, n)
+        pending = pending[need:]
+
+def _rounding_tie(x, tol, digits=3):
+    # x è entro tol da un punto di arrotondamento a `digits` decimali (…5)
+    scaled = x * 10 ** digits
+    return abs(scaled - math.floor(scaled) - 0.5) <= tol * 10 ** digits
+
+def ci_bootstrap_many(columns, alpha=0.05, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED):
+    """
+    Media e intervallo bootstrap percentile di più metriche misurate sugli stessi
+    utenti: un'unica matrice di indici di ricampionamento, condivisa da tutte.
+
+    Le medie dei ricampionamenti sono calcolate in NumPy (somma a coppie), che
+    può differire di qualche ulp da `statistics.mean` (somma esatta). Con metriche
+    discrete la media cade spesso esattamente su un …5 e l'arrotondamento a 3
+    decimali cambierebbe: se un estremo è a ridosso di un …5, le medie vicine
+    sono ricalcolate con `statistics.mean` (rigenerando solo quei ricampionamenti),
+    quindi i valori restituiti sono identici alla versione con i cicli Python.
+
+    :param columns: nome metrica -> valori per utente (stessa lunghezza)
+    :return: nome metrica -> (media, estremo basso, estremo alto) arrotondati a 3 decimali
+    """
+    names = list(columns)
+    values = [np.asarray(columns[m], dtype=np.float64) for m in names]
+    n = values[0].size if values else 0
+    if n == 0:
+        return {m: (0.0, 0.0, 0.0) for m in names}
+
+    boots = np.empty((len(names), B))
+    done = 0
+    for idx in bootstrap_indices(n, B, seed):
+        for j, v in enumerate(values):
+            boots[j, done:done + idx.shape[0]] = v[idx].mean(axis=1)
+        done += idx.shape[0]
+    ranked = np.sort(boots, axis=1)
+    positions = (int((alpha/2)*B), int((1 - alpha/2)*B)-1)
+
+    # estremi vicini a un …5: ricampionamenti da rifare in modo esatto
+    exact_rows, ties = {}, []
+    for j, v in enumerate(values):
+        # errore della media NumPy molto sotto tol (log2(n) ulp del massimo)
+        tol = 1e-9 * (1.0 + float(np.abs(v).max()))
+        for p in positions:
+            x = ranked[j, p]
+            if _rounding_tie(x, tol):
+                near = np.flatnonzero(np.abs(boots[j] - x) <= tol)
+                below = int(np.count_nonzero(boots[j] < x - tol))
+                exact_rows.setdefault(j, set()).update(near.tolist())
+                ties.append((j, p, near, below))
+    if ties:
+        exact = {j: {} for j in exact_rows}
+        done = 0
+        for idx in bootstrap_indices(n, B, seed):
+            for j, rows in exact_rows.items():
+                for r in rows:
+                    if done <= r < done + idx.shape[0]:
+                        exact[j][r] = mean(values[j][idx[r - done]].tolist())
+            done += idx.shape[0]
+        for j, p, near, below in ties:
+            ranked[j, p] = sorted(exact[j][r] for r in near.tolist())[p - below]
+
+    low = ranked[:, positions[0]]
+    high = ranked[:, positions[1]]
+    return {m: (round(mean(v.tolist()), 3), round(float(lo), 3), round(float(hi), 3))
+            for m, v, lo, hi in zip(names, values, low, high)}
+
 def ci_bootstrap(values, alpha=0.05, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED):
-    if not values: return (0.0, 0.0, 0.0)
-    rnd = random.Random(seed)
-    n = len(values)
-    boots = []
-    for _ in range(B):
-        sample = [values[rnd.randrange(n)] for _ in range(n)]
-        boots.append(mean(sample))
-    boots.sort()
-    low = boots[int((alpha/2)*B)]
-    high = boots[int((1 - alpha/2)*B)-1]
-    return (round(mean(values), 3), round(low, 3), round(high, 3))
+    return ci_bootstrap_many({"values": values}, alpha, B, seed)["values"]
+
+def latency_summary(latencies):
+    """
+    Percentili delle latenze (ms) per endpoint.
+    """
+    out = {}
+    for endpoint, values in sorted(latencies.items()):
+        ms = np.asarray(values) * 1000
+        out[endpoint] = {"count": int(ms.size)}
+        for q in (50, 90, 99):
+            out[endpoint][f"p{q}_ms"] = round(float(np.percentile(ms, q)), 2)
+        out[endpoint]["max_ms"] = round(float(ms.max()), 2)
+    return out
 
 # ========== valutazione per utente ==========
-def eval_user(user_id, prefs, relevant_ids, top_k=TOP_K_DEFAULT, epsilon=0.35, candidate_pool=160, explore_extra=400, seed=42):
+def bandit_settings(epsilons=(0.35,), candidate_pools=(160,)):
+    """
+    Configurazioni bandit da valutare (epsilon x candidate_pool) con il nome del
+    metodo nei risultati: "bandit" se è una sola, altrimenti con i parametri.
+    """
+    combos = list(itertools.product(epsilons, candidate_pools))
+    if len(combos) == 1:
+        return [("bandit", {"epsilon": combos[0][0], "candidate_pool": combos[0][1]})]
+    return [(f"bandit eps={eps} pool={pool}", {"epsilon": eps, "candidate_pool": pool})
+            for eps, pool in combos]
+
+BANDIT_DEFAULT = bandit_settings()
+
+def eval_user(user_id, prefs, relevant_ids, top_k=TOP_K_DEFAULT, bandits=BANDIT_DEFAULT, explore_extra=400, seed=42):
     # constraint
     c_resp = fetch_recs(user_id, method="constraint", top_k=top_k)
-    c_results = c_resp["results"]
-
-    # bandit
-    b_resp = fetch_recs(
-        user_id,
-        method="bandit",
-        top_k=top_k,
-        epsilon=epsilon,
-        candidate_pool=candidate_pool,
-        explore_extra=explore_extra,
-        seed=seed
+
+    # bandit (una risposta per configurazione)
+    b_resps = [
+        (label, fetch_recs(user_id, method="bandit", top_k=top_k, explore_extra=explore_extra, seed=seed, **params))
+        for label, params in bandits
+    ]
+    return user_rows(user_id, prefs, relevant_ids, c_resp, b_resps, top_k=top_k)
+
+async def eval_user_async(client, sem, user_id, relevant_ids, retries=RETRIES_DEFAULT, top_k=TOP_K_DEFAULT,
+                          bandits=BANDIT_DEFAULT, explore_extra=400, seed=42):
+    # preferenze, constraint e bandit in parallelo
+    prefs, c_resp, *b_list = await asyncio.gather(
+        fetch_user_prefs_async(client, sem, user_id, retries),
+        fetch_recs_async(client, sem, user_id, method="constraint", retries=retries, top_k=top_k),
+        *(fetch_recs_async(client, sem, user_id, method="bandit", retries=retries, top_k=top_k,
+                           explore_extra=explore_extra, seed=seed, **params) for _, params in bandits),
     )
-    b_results = b_resp["results"]
-    b_meta = b_resp.get("meta", {}) or {}
-    b_diag = b_meta.get("diagnostics") or {}
+    b_resps = [(label, resp) for (label, _), resp in zip(bandits, b_list)]
+    return user_rows(user_id, prefs, relevant_ids, c_resp, b_resps, top_k=top_k)
+
+def method_row(user_id, method, results, meta, prefs, relevant_ids, top_k=TOP_K_DEFAULT):
+    """
+    Riga di metriche di un utente per un metodo.
+    """
+    ild_val = diversity_ild(results)
+    row = {
+        "user_id": user_id,
+        "method": method,
+        "n": len(results),
+        "accuracy": accuracy(results),
+        "partial_accuracy": partial_accuracy(results),
+        "ild": ild_val,
+        "diversity": ild_val,  # retro-compatibilità: diversity = ILD
+        "serendipity": serendipity(results, prefs),
+        "precision@k": precision_at_k(results, relevant_ids, prefs, k=top_k),
+        "recall@k": recall_at_k(results, relevant_ids, prefs, k=top_k),
+        "ndcg@k": ndcg_at_k(results, relevant_ids, prefs, k=top_k),
+        "movie_ids": [r.get("movie_id") for r in results if r.get("movie_id")],
+    }
+    # aggiungi diagnostica bandit se presente
+    if meta.get("diagnostics") is not None:
+        d = meta["diagnostics"]
+        row["bandit_meta"] = {
+            "epsilon": meta.get("epsilon"),
+            "exploit_pool_size": d.get("exploit_pool_size"),
+            "explore_pool_size": d.get("explore_pool_size"),
+            "explore_ratio": d.get("explore_ratio"),
+            "novel_count": d.get("novel_count")
+        }
+    return row
+
+def user_rows(user_id, prefs, relevant_ids, c_resp, b_resps, top_k=TOP_K_DEFAULT):
+    """
+    Righe di metriche (constraint e ogni configurazione bandit) di un utente a partire dalle risposte.
+
+    :param b_resps: lista di (metodo, risposta bandit)
+    """
+    rows = [method_row(user_id, "constraint", c_resp["results"], {"epsilon": None, "diagnostics": None},
+                       prefs, relevant_ids, top_k)]
+    for method, b_resp in b_resps:
+        b_meta = b_resp.get("meta", {}) or {}
+        meta = {"epsilon": b_meta.get("epsilon"), "diagnostics": b_meta.get("diagnostics") or {}}
+        rows.append(method_row(user_id, method, b_resp["results"], meta, prefs, relevant_ids, top_k))
+    return rows
 
+# ========== Valutazione in-process (senza HTTP) ==========
+# backend e popolazione impostati dal padre prima del fork: i processi del pool li
+# ereditano (pagine condivise copy-on-write) invece di riceverli a ogni task
+_INPROC = {}
+
+def synthetic_prefs(index, seed, directors):
+    """
+    Profilo sintetico riproducibile: dipende solo da indice e seed (non dal worker
+    né dalla suddivisione in blocchi).
+    """
+    rng = np.random.default_rng([seed, index])
+    genres = rng.permutation(GENRES[1:]).tolist()
+    n_wanted = int(rng.integers(1, 4))
+    n_banned = int(rng.integers(0, 3))
+    runtime = int(rng.integers(80, 151)) if rng.random() < 0.5 else None
+    return {
+        "min_release_year": int(rng.choice([0, 1970, 1980, 1990])),
+        "generi_desiderati": genres[:n_wanted],
+        "generi_vietati": genres[n_wanted:n_wanted + n_banned],
+        "prefer_award_winning": bool(rng.random() < 0.3),
+        "preferred_runtime": runtime,
+        "tolleranza_runtime": int(rng.integers(10, 31)) if runtime is not None else 0,
+        "favorite_directors": [directors[i] for i in rng.choice(len(directors), size=int(rng.integers(0, 3)), replace=False)],
+    }
+
+def _inproc_profile(i):
+    if "users" in _INPROC:
+        uid = _INPROC["users"][i]
+        return uid, _INPROC["prefs"][uid], _INPROC["relevant"].get(uid)
+    prefs = synthetic_prefs(i, _INPROC["seed"], _INPROC["directors"])
+    return f"synthetic-{i:07d}", _INPROC["api"].normalize_prefs(prefs), None
+
+def eval_user_inprocess(api, user_id, prefs, relevant_ids, top_k=TOP_K_DEFAULT, bandits=BANDIT_DEFAULT,
+                        explore_extra=400, seed=42):
+    # stesse funzioni degli endpoint: risposte identiche a quelle HTTP
+    c_resp = _recs_payload("constraint", api.recommendations_payload(user_id, prefs, top_k))
+    b_resps = [
+        (label, _recs_payload("bandit", api.bandit_payload(user_id, prefs, top_k, explore_extra=explore_extra,
+                                                           seed=seed, **params)))
+        for label, params in bandits
+    ]
+    return user_rows(user_id, prefs, relevant_ids, c_resp, b_resps, top_k=top_k)
+
+def _eval_range(bounds):
+    start, stop = bounds
     rows = []
+    for i in range(start, stop):
+        uid, prefs, relevant_ids = _inproc_profile(i)
+        try:
+            rows.extend(eval_user_inprocess(_INPROC["api"], uid, prefs, relevant_ids, **_INPROC["params"]))
+        except Exception as e:
+            print(f"Errore {uid}: {e}", flush=True)
+    return rows
 
-    for method, results, meta in (
-        ("constraint", c_results, {"epsilon": None, "diagnostics": None}),
-        ("bandit", b_results, {"epsilon": b_meta.get("epsilon"), "diagnostics": b_diag}),
-    ):
-        ild_val = diversity_ild(results)
-        row = {
-            "user_id": user_id,
-            "method": method,
-            "n": len(results),
-            "accuracy": accuracy(results),
-            "partial_accuracy": partial_accuracy(results),
-            "ild": ild_val,
-            "diversity": ild_val,  # retro-compatibilità: diversity = ILD
-            "serendipity": serendipity(results, prefs),
-            "precision@k": precision_at_k(results, relevant_ids, prefs, k=top_k),
-            "recall@k": recall_at_k(results, relevant_ids, prefs, k=top_k),
-            "ndcg@k": ndcg_at_k(results, relevant_ids, prefs, k=top_k),
-            "movie_ids": [r.get("movie_id") for r in results if r.get("movie_id")],
-        }
-        # aggiungi diagnostica bandit se presente
-        if method == "bandit" and meta.get("diagnostics") is not None:
-            d = meta["diagnostics"]
-            row["bandit_meta"] = {
-                "epsilon": meta.get("epsilon"),
-                "exploit_pool_size": d.get("exploit_pool_size"),
-                "explore_pool_size": d.get("explore_pool_size"),
-                "explore_ratio": d.get("explore_ratio"),
-                "novel_count": d.get("novel_count")
-            }
-        rows.append(row)
+def run_inprocess(params, workers=0, synthetic=0, synthetic_seed=SYNTHETIC_SEED, chunk=INPROC_CHUNK):
+    """
+    Valutazione chiamando direttamente le funzioni di raccomandazione del backend.
 
-    return rows
+    Il padre importa il backend una sola volta (catalogo, artefatti, utenti), poi
+    i worker creati con fork valutano blocchi di `chunk` utenti; le righe arrivano
+    nell'ordine degli utenti e vengono restituite man mano (generatore).
 
-# ========== main ==========
-def main():
-    users = fetch_user_ids()
-    if not users:
-        print("Nessun utente trovato")
+    :param workers: processi (0 = tutti i core, 1 = nel processo corrente)
+    :param synthetic: se > 0, tanti profili sintetici al posto degli utenti salvati
+    """
+    import main as api  # backend/main.py (backend/ è nel sys.path)
+
+    _INPROC.update(api=api, params=params)
+    if synthetic > 0:
+        n = synthetic
+        directors = sorted(api.df["director"].dropna().unique().tolist())
+        _INPROC.update(seed=synthetic_seed, directors=directors)
+    else:
+        prefs = api.USERS.all()
+        users = [uid for uid in api.USERS.ids() if uid in prefs]
+        n = len(users)
+        _INPROC.update(users=users, prefs=prefs, relevant=load_relevant_local())
+
+    bounds = [(s, min(s + chunk, n)) for s in range(0, n, chunk)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for b in bounds:
+            yield from _eval_range(b)
         return
 
+    # oggetti del backend fuori dal GC dei figli: nessuna pagina condivisa sporcata
+    gc.freeze()
+    with mp.get_context("fork").Pool(workers) as pool:
+        for rows in pool.imap(_eval_range, bounds):
+            yield from rows
+
+# ========== Aggregazione ==========
+AGG_METRICS = ("precision@k","recall@k","ndcg@k","ild","serendipity","accuracy","partial_accuracy")
+
+class StreamingAggregate:
+    """
+    Aggregato per metodo alimentato una riga alla volta: conserva solo i valori
+    delle metriche e i movie_id raccomandati, non le righe complete.
+    """
+
+    def __init__(self):
+        self.values = defaultdict(lambda: defaultdict(list))
+        self.recommended = defaultdict(list)
+        self.users = set()
+
+    def add(self, row):
+        m = row["method"]
+        for k in AGG_METRICS:
+            self.values[m][k].append(row[k])
+        self.recommended[m].append(row["movie_ids"])
+        self.users.add(row["user_id"])
+
+    def result(self):
+        aggregate = {}
+        for method, vals in self.values.items():
+            cis = ci_bootstrap_many({k: vals[k] for k in AGG_METRICS}, alpha=0.05, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED)
+            out_m = {k: {"mean": mu, "ci95": [lo, hi]} for k, (mu, lo, hi) in cis.items()}
+            X = incidence_matrix(self.recommended[method])
+            out_m["coverage"] = round(coverage(X), 3)
+            out_m["personalization_jaccard"] = round(personalization_jaccard(X), 3)
+            aggregate[method] = out_m
+        return aggregate
+
+# ========== main ==========
+EVAL_PARAMS = dict(top_k=TOP_K_DEFAULT, explore_extra=400, seed=42)
+
+def run_sync(params):
+    users = fetch_user_ids()
     prefs_map = {uid: fetch_user_prefs(uid) for uid in users}
     relevant_local = load_relevant_local()
 
-    all_rows = []
     for uid in users:
         try:
             relevant_ids = relevant_local.get(uid)  # None se manca: useremo proxy
-            all_rows.extend(
-                eval_user(
-                    uid,
-                    prefs_map.get(uid, {}),
-                    relevant_ids,
-                    top_k=TOP_K_DEFAULT,
-                    epsilon=0.35,
-                    candidate_pool=160,
-                    explore_extra=400,
-                    seed=42
-                )
-            )
+            yield from eval_user(uid, prefs_map.get(uid, {}), relevant_ids, **params)
         except Exception as e:
             print(f"Errore {uid}: {e}")
 
-    # aggregazione
-    agg = defaultdict(lambda: defaultdict(list))
-    per_method_results = defaultdict(list)
-    for r in all_rows:
-        m = r["method"]
-        for k in ("accuracy","partial_accuracy","ild","serendipity","precision@k","recall@k","ndcg@k"):
-            agg[m][k].append(r[k])
-        per_method_results[m].append([{"movie_id": mid} for mid in r["movie_ids"]])
-
-    aggregate = {}
-    for method, vals in agg.items():
-        out_m = {}
-        for metric_key in ("precision@k","recall@k","ndcg@k","ild","serendipity","accuracy","partial_accuracy"):
-            mu, lo, hi = ci_bootstrap(vals[metric_key], alpha=0.05, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED)
-            out_m[metric_key] = {"mean": mu, "ci95": [lo, hi]}
-        out_m["coverage"] = round(coverage(per_method_results[method]), 3)
-        out_m["personalization_jaccard"] = round(personalization_jaccard(per_method_results[method]), 3)
-        aggregate[method] = out_m
-
-    out = {
-        "per_user": all_rows,
-        "aggregate": aggregate,
+async def run_async(params, concurrency=CONCURRENCY_DEFAULT, retries=RETRIES_DEFAULT):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=BASE, limits=limits, timeout=30) as client:
+        sem = asyncio.Semaphore(concurrency)
+        users = (await _aget_json(client, sem, "users", "/users", retries=retries)).get("users", [])
+        if not users:
+            return []
+
+        relevant_local = load_relevant_local()
+        outcomes = await asyncio.gather(
+            *(eval_user_async(client, sem, uid, relevant_local.get(uid), retries, **params) for uid in users),
+            return_exceptions=True,
+        )
+
+    # righe nell'ordine degli utenti, come la valutazione sequenziale
+    all_rows = []
+    for uid, outcome in zip(users, outcomes):
+        if isinstance(outcome, Exception):
+            print(f"Errore {uid}: {outcome}")
+        else:
+            all_rows.extend(outcome)
+    return all_rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione dei recommender tramite l'API o in-process.")
+    parser.add_argument("--mode", choices=["sync", "async", "inprocess"], default="sync",
+                        help="sync: un utente e una richiesta alla volta; async: richieste concorrenti con pool "
+                             "keep-alive; inprocess: funzioni del backend senza server, su più processi")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY_DEFAULT, help="richieste in volo (async)")
+    parser.add_argument("--retries", type=int, default=RETRIES_DEFAULT, help="tentativi extra per richiesta (async)")
+    parser.add_argument("--workers", type=int, default=0, help="processi (inprocess, 0 = tutti i core)")
+    parser.add_argument("--synthetic", type=int, default=0,
+                        help="valuta N profili sintetici invece degli utenti salvati (inprocess)")
+    parser.add_argument("--synthetic-seed", type=int, default=SYNTHETIC_SEED)
+    parser.add_argument("--epsilon", type=float, nargs="+", default=[0.35], help="uno o più epsilon del bandit")
+    parser.add_argument("--candidate-pool", type=int, nargs="+", default=[160],
+                        help="una o più dimensioni del pool exploit del bandit")
+    parser.add_argument("--per-user-file", default=None,
+                        help="scrive le righe per utente in JSON Lines invece che in results.json "
+                             f"(default con --mode inprocess: {PER_USER_FILE_DEFAULT})")
+    args = parser.parse_args()
+
+    if args.synthetic and args.mode != "inprocess":
+        parser.error("--synthetic richiede --mode inprocess")
+    per_user_file = args.per_user_file
+    if per_user_file is None and args.mode == "inprocess":
+        per_user_file = PER_USER_FILE_DEFAULT
+
+    bandits = bandit_settings(args.epsilon, args.candidate_pool)
+    params = dict(EVAL_PARAMS, bandits=bandits)
+
+    t0 = time.perf_counter()
+    if args.mode == "async":
+        rows = asyncio.run(run_async(params, args.concurrency, args.retries))
+        concurrency = args.concurrency
+    elif args.mode == "inprocess":
+        rows = run_inprocess(params, args.workers, args.synthetic, args.synthetic_seed)
+        concurrency = args.workers or os.cpu_count() or 1
+    else:
+        rows = run_sync(params)
+        concurrency = 1
+
+    # righe consumate man mano: su file (JSON Lines) o, senza file, in results.json
+    agg = StreamingAggregate()
+    per_user = []
+    sink = open(per_user_file, "w", encoding="utf-8") if per_user_file else None
+    try:
+        for row in rows:
+            agg.add(row)
+            if sink is None:
+                per_user.append(row)
+            else:
+                sink.write(json.dumps(row, ensure_ascii=False) + "\n")
+    finally:
+        if sink is not None:
+            sink.close()
+    wall_time = time.perf_counter() - t0
+    if not agg.users:
+        print("Nessun utente trovato")
+        return
+
+    timing = {
+        "mode": args.mode,
+        "concurrency": concurrency,
+        "wall_time_s": round(wall_time, 3),
+        "users_per_s": round(len(agg.users) / wall_time, 1),
+        "latency": latency_summary(LATENCIES),
+    }
+    out = {"per_user_file": per_user_file} if per_user_file else {"per_user": per_user}
+    out.update({
+        "aggregate": agg.result(),
         "settings": {
             "top_k": TOP_K_DEFAULT,
             "bootstrap_B": BOOTSTRAP_B,
-            "catalog_size": CATALOG_SIZE
-        }
-    }
+            "catalog_size": CATALOG_SIZE,
+            "users": len(agg.users),
+            "population": f"synthetic (seed {args.synthetic_seed})" if args.synthetic else "users",
+            "bandit": [{"method": label, **p, "explore_extra": EVAL_PARAMS["explore_extra"], "seed": EVAL_PARAMS["seed"]}
+                       for label, p in bandits],
+        },
+        "timing": timing,
+    })
     with open("results.json","w",encoding="utf-8") as f:
         json.dump(out, f, indent=2, ensure_ascii=False)
-    print("Risultati salvati in results.json")
+    print(f"Risultati salvati in results.json ({args.mode}, {len(agg.users)} utenti, {wall_time:.2f} s)")
+    for endpoint, st in timing["latency"].items():
+        print(f"  {endpoint:12s} n={st['count']:6d}  p50 {st['p50_ms']:8.2f} ms  p90 {st['p90_ms']:8.2f} ms  p99 {st['p99_ms']:8.2f} ms")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import random
+
+import numpy as np
+import pandas as pd
+
+# moduli del backend (catalog, config, ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import config
+from catalog import Catalog
+from genres import GENRES
+
+N_USERS = [1_000, 10_000, 50_000]
+TOP_K = 10
+
+
+def load_catalog() -> Catalog:
+    df = pd.read_csv(config.MOVIES_FILE)
+    df["release_date"] = pd.to_datetime(df["release_date"], errors="coerce")
+    df["runtime"] = pd.to_numeric(df["runtime"], errors="coerce")
+    df["awards"] = pd.to_numeric(df["awards"], errors="coerce").fillna(0)
+    return Catalog(df)
+
+
+def synthetic_prefs(cat: Catalog, n: int, seed: int = 0) -> list[dict]:
+    rnd = random.Random(seed)
+    directors = list(cat.director_index)
+    prefs = []
+    for _ in range(n):
+        prefs.append({
+            "min_release_year": rnd.choice([0, 1980, 1990, 1995]),
+            "generi_desiderati": rnd.sample(GENRES[1:], rnd.randint(1, 3)),
+            "generi_vietati": rnd.sample(GENRES[1:], rnd.randint(0, 2)),
+            "prefer_award_winning": rnd.random() < 0.5,
+            "preferred_runtime": rnd.choice([None, 5400, 6300, 7200]),
+            "tolleranza_runtime": rnd.choice([600, 900, 1200]),
+            "favorite_directors": rnd.sample(directors, rnd.randint(0, 2)),
+        })
+    return prefs
+
+
+def main():
+    cat = load_catalog()
+    print(f"Catalogo: {cat.size} film, top_k={TOP_K}")
+
+    prefs = synthetic_prefs(cat, 2_000)
+    t0 = time.perf_counter()
+    for p in prefs:
+        cat.recommend(p, top_k=TOP_K)
+    single = len(prefs) / (time.perf_counter() - t0)
+    print(f"recommend (un utente alla volta): {single:,.0f} utenti/s")
+
+    for n in N_USERS:
+        prefs = synthetic_prefs(cat, n)
+        t0 = time.perf_counter()
+        cat.recommend_batch(prefs, top_k=TOP_K)
+        dt = time.perf_counter() - t0
+        print(f"recommend_batch {n:>6} utenti: {dt:.2f}s -> {n / dt:,.0f} utenti/s")
+
+
+if __name__ == "__main__":
+    main()
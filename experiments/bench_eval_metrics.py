@@ -0,0 +1,101 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from statistics import mean
+
+import numpy as np
+
+# eval_recsys.py (radice del repository) e moduli del backend che importa
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "backend"))
+from eval_recsys import (AGG_METRICS, BOOTSTRAP_B, BOOTSTRAP_SEED, CATALOG_SIZE, TOP_K_DEFAULT,
+                         ci_bootstrap_many, coverage, incidence_matrix, personalization_jaccard)
+
+
+# ---- versioni precedenti (cicli Python), come riferimento ----
+def loop_ci_bootstrap(values, alpha=0.05, B=BOOTSTRAP_B, seed=BOOTSTRAP_SEED):
+    if not values: return (0.0, 0.0, 0.0)
+    rnd = random.Random(seed)
+    n = len(values)
+    boots = []
+    for _ in range(B):
+        sample = [values[rnd.randrange(n)] for _ in range(n)]
+        boots.append(mean(sample))
+    boots.sort()
+    low = boots[int((alpha/2)*B)]
+    high = boots[int((1 - alpha/2)*B)-1]
+    return (round(mean(values), 3), round(low, 3), round(high, 3))
+
+
+def loop_coverage(id_lists):
+    return len({str(mid) for ids in id_lists for mid in ids}) / CATALOG_SIZE
+
+
+def loop_personalization(id_lists):
+    if len(id_lists) < 2: return 0.0
+    sims = []
+    for a, b in itertools.combinations(id_lists, 2):
+        setA = {str(m) for m in a}
+        setB = {str(m) for m in b}
+        inter = len(setA & setB); union = len(setA | setB)
+        sims.append(inter / (union or 1))
+    return 1 - (sum(sims) / len(sims))
+
+
+def synthetic_population(n_users: int, seed: int = 0):
+    """
+    Metriche per utente e liste di top_k film con popolarità a legge di potenza
+    (molte liste condividono i film più popolari, come nei risultati reali).
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for k in AGG_METRICS:
+        if k in ("accuracy", "partial_accuracy", "precision@k", "serendipity"):
+            columns[k] = (rng.integers(0, TOP_K_DEFAULT + 1, n_users) / TOP_K_DEFAULT).tolist()
+        else:
+            columns[k] = rng.random(n_users).tolist()
+    popularity = 1.0 / np.arange(1, CATALOG_SIZE + 1) ** 0.8
+    popularity /= popularity.sum()
+    picks = rng.choice(CATALOG_SIZE, size=(n_users, TOP_K_DEFAULT * 2), p=popularity) + 1
+    id_lists = [list(dict.fromkeys(row.tolist()))[:TOP_K_DEFAULT] for row in picks]
+    return columns, id_lists
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bootstrap, coverage e personalization di eval_recsys: NumPy contro cicli Python.")
+    parser.add_argument("--users", type=int, nargs="*", default=[2_000, 10_000, 100_000])
+    parser.add_argument("--reference-users", type=int, default=2_000,
+                        help="popolazioni fino a questa dimensione confrontate anche con i cicli Python")
+    args = parser.parse_args()
+
+    for n in args.users:
+        columns, id_lists = synthetic_population(n)
+        cis, t_boot = timed(ci_bootstrap_many, columns)
+        X, t_inc = timed(incidence_matrix, id_lists)
+        cov, t_cov = timed(coverage, X)
+        pers, t_pers = timed(personalization_jaccard, X)
+        print(f"utenti={n:>7,}: bootstrap ({len(AGG_METRICS)} metriche) {t_boot:7.2f} s  "
+              f"incidenza {t_inc:6.2f} s  coverage {t_cov * 1000:5.1f} ms  personalization {t_pers:7.2f} s  "
+              f"(coverage {cov:.3f}, personalization {pers:.4f})", flush=True)
+
+        if n <= args.reference_users:
+            ref_cis, t_ref_boot = timed(lambda: {k: loop_ci_bootstrap(v) for k, v in columns.items()})
+            ref_cov = loop_coverage(id_lists)
+            ref_pers, t_ref_pers = timed(loop_personalization, id_lists)
+            same = ref_cis == cis and round(ref_cov, 3) == round(cov, 3) and round(ref_pers, 3) == round(pers, 3)
+            print(f"    cicli Python: bootstrap {t_ref_boot:7.2f} s  personalization {t_ref_pers:7.2f} s  "
+                  f"risultati {'identici' if same else 'DIVERSI'}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+# moduli del backend (config, offline_eval, ...) e generatore di bench_precompute.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from bench_precompute import SCALES, synthetic_ratings
+from offline_eval import evaluate_split, leave_last_n_out, time_cut
+from precompute import load_ratings
+
+# intervallo dei timestamp sintetici (quello di MovieLens 100k)
+TS_RANGE = (874_724_710, 893_286_638)
+
+
+def ratings_for(scale: str, seed: int = 0):
+    if SCALES[scale] is None:
+        return load_ratings(timestamps=True)
+    ratings = synthetic_ratings(*SCALES[scale], seed=seed)
+    ratings["timestamp"] = np.random.default_rng(seed).integers(*TS_RANGE, size=len(ratings))
+    return ratings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo della valutazione offline (split temporali, SVD, metriche) per scala.")
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), choices=list(SCALES))
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        t0 = time.perf_counter()
+        ratings = ratings_for(scale)
+        t_load = time.perf_counter() - t0
+        for name, split in (("leave-last-5", lambda: leave_last_n_out(ratings, 5)),
+                            ("taglio 0.2", lambda: time_cut(ratings, 0.2)[0])):
+            t1 = time.perf_counter()
+            test = split()
+            t_split = time.perf_counter() - t1
+            result = evaluate_split(ratings, test)
+            total = time.perf_counter() - t1
+            svd = result["methods"]["svd"]
+            print(f"{scale:>4} {name:12s}: {result['users_evaluated']:>7,} utenti  split {t_split:5.2f} s  "
+                  f"SVD {result['timing']['fit_s']:6.2f} s  ranking+metriche {result['timing']['svd_s']:6.2f} s  "
+                  f"totale {total:6.2f} s  (lettura/generazione {t_load:.1f} s)  "
+                  f"ndcg@k {svd['ndcg@k']:.4f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import TruncatedSVD
+
+# moduli del backend (config, precompute, ...)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+import config
+from precompute import load_ratings, utility_matrix
+
+# (utenti, film, rating) delle scale MovieLens; 100k usa ratings.csv reale
+SCALES = {
+    "100k": None,
+    "1M": (6_040, 3_706, 1_000_209),
+    "25M": (162_541, 59_047, 25_000_095),
+}
+# oltre questa dimensione la pivot densa non sta in memoria: ne riporta solo la stima
+DENSE_MAX_CELLS = 50_000_000
+
+
+def synthetic_ratings(n_users: int, n_items: int, n_ratings: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Rating sintetici con popolarità dei film e attività degli utenti a coda lunga (coppie uniche).
+    """
+    rng = np.random.default_rng(seed)
+    item_p = 1.0 / (np.arange(n_items) + 10.0) ** 0.9
+    user_p = 1.0 / (np.arange(n_users) + 50.0) ** 0.6
+
+    # coppie (utente, film) uniche, come nei dataset MovieLens: si ricampiona finché mancano rating
+    keys = np.empty(0, dtype=np.int64)
+    while keys.size < n_ratings:
+        n = int((n_ratings - keys.size) * 1.3) + 1
+        users = rng.choice(n_users, size=n, p=user_p / user_p.sum())
+        items = rng.choice(n_items, size=n, p=item_p / item_p.sum())
+        keys = np.union1d(keys, users.astype(np.int64) * n_items + items)
+    keys = rng.choice(keys, size=n_ratings, replace=False)
+    return pd.DataFrame({
+        "user_id": (keys // n_items + 1).astype(np.int32),
+        "movie_id": (keys % n_items + 1).astype(np.int32),
+        "rating": rng.integers(1, 6, size=keys.size).astype(np.float32),
+    })
+
+
+def measure(fn):
+    """
+    Esegue fn e restituisce (risultato, secondi, picco di memoria allocata in MB).
+    """
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, dt, peak / 2**20
+
+
+def dense_pipeline(ratings: pd.DataFrame):
+    # percorso precedente: pivot_table densa utenti x film, poi SVD
+    X = ratings.pivot_table(values="rating", index="user_id", columns="movie_id", fill_value=0).T
+    return TruncatedSVD(n_components=30, random_state=42).fit_transform(X)
+
+
+def sparse_pipeline(ratings: pd.DataFrame):
+    X, _, _ = utility_matrix(
+        ratings["user_id"].to_numpy(), ratings["movie_id"].to_numpy(), ratings["rating"].to_numpy()
+    )
+    return TruncatedSVD(n_components=30, random_state=42).fit_transform(X)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo e memoria di picco della costruzione matrice utility + SVD.")
+    parser.add_argument("--scales", nargs="+", default=list(SCALES), choices=list(SCALES))
+    args = parser.parse_args()
+
+    for scale in args.scales:
+        if SCALES[scale] is None:
+            ratings = load_ratings(config.RATINGS_FILE)
+        else:
+            ratings = synthetic_ratings(*SCALES[scale])
+        n_users, n_items = ratings["user_id"].nunique(), ratings["movie_id"].nunique()
+        cells = n_users * n_items
+        print(f"\n== {scale}: {len(ratings):,} rating, {n_users:,} utenti, {n_items:,} film ==")
+
+        _, dt, peak = measure(lambda: sparse_pipeline(ratings))
+        print(f"sparsa (CSR): {dt:7.2f}s  picco {peak:9.1f} MB")
+
+        if cells <= DENSE_MAX_CELLS:
+            _, dt, peak = measure(lambda: dense_pipeline(ratings))
+            print(f"densa (pivot): {dt:6.2f}s  picco {peak:9.1f} MB")
+        else:
+            print(f"densa (pivot): saltata, la sola matrice float64 occupa {cells * 8 / 2**30:,.1f} GB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+import argparse
+import http.client
+import json
+import multiprocessing as mp
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+
+# moduli del backend (config, ...)
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, BACKEND_DIR)
+import config
+
+HOST = "127.0.0.1"
+N_USERS = 200
+N_TITLES = 200
+
+
+def get_json(port: int, path: str):
+    conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    try:
+        conn.request("GET", path)
+        return json.loads(conn.getresponse().read())
+    finally:
+        conn.close()
+
+
+def wait_ready(port: int, proc: subprocess.Popen, timeout: float = 180.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"serve.py terminato con codice {proc.returncode}")
+        try:
+            get_json(port, "/users?limit=1")
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError("serve.py non risponde")
+
+
+def request_paths(port: int) -> list[str]:
+    """
+    Mix di richieste CPU-bound: constraint-based, film simili e bandit (senza cache).
+    """
+    users = get_json(port, f"/users?limit={N_USERS}")["users"]
+    with open(config.MOVIES_LIST_FILE, encoding="utf-8") as f:
+        titles = json.load(f)[:N_TITLES]
+    paths = []
+    for i in range(max(len(users), len(titles))):
+        uid = urllib.parse.quote(users[i % len(users)], safe="")
+        title = urllib.parse.quote(titles[i % len(titles)], safe="")
+        paths += [
+            f"/recommendations/{uid}?top_k=10",
+            f"/similar_movies/{title}?top_k=10",
+            f"/recommendations_bandit/{uid}?top_k=10&seed={i}",
+        ]
+    return paths
+
+
+def client(args) -> list[float]:
+    """
+    Un client con connessione keep-alive: richieste in sequenza fino alla scadenza.
+    """
+    port, paths, offset, deadline = args
+    conn = http.client.HTTPConnection(HOST, port, timeout=60)
+    latencies = []
+    i = offset
+    while time.time() < deadline:
+        t0 = time.perf_counter()
+        conn.request("GET", paths[i % len(paths)])
+        resp = conn.getresponse()
+        resp.read()
+        if resp.status != 200:
+            raise RuntimeError(f"{paths[i % len(paths)]}: HTTP {resp.status}")
+        latencies.append(time.perf_counter() - t0)
+        i += 1
+    conn.close()
+    return latencies
+
+
+def memory_kb(root: int) -> tuple[int, int]:
+    """
+    RSS e PSS (kB) sommati su padre e worker. La PSS divide le pagine condivise
+    tra i processi che le mappano: è la memoria realmente occupata dal gruppo.
+    """
+    with open(f"/proc/{root}/task/{root}/children") as f:
+        pids = [root] + [int(p) for p in f.read().split()]
+    rss = pss = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                if line.startswith("Rss:"):
+                    rss += int(line.split()[1])
+                elif line.startswith("Pss:"):
+                    pss += int(line.split()[1])
+    return rss, pss
+
+
+def bench(workers: int, args):
+    proc = subprocess.Popen(
+        [sys.executable, "serve.py", "--host", HOST, "--port", str(args.port),
+         "--workers", str(workers), "--users-backend", args.users_backend, "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+    )
+    try:
+        wait_ready(args.port, proc)
+        paths = request_paths(args.port)
+        with mp.Pool(args.clients) as pool:
+            # riscaldamento (prime pagine toccate, cache riempite), poi misura
+            pool.map(client, [(args.port, paths, c * 997, time.time() + args.warmup) for c in range(args.clients)])
+            t0 = time.time()
+            runs = pool.map(client, [(args.port, paths, c * 997, t0 + args.duration) for c in range(args.clients)])
+            elapsed = time.time() - t0
+        rss, pss = memory_kb(proc.pid)
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        proc.wait(timeout=60)
+
+    lat = np.concatenate([np.asarray(r) for r in runs]) * 1000
+    print(f"worker={workers}: {lat.size / elapsed:8,.1f} richieste/s  "
+          f"p50 {np.percentile(lat, 50):6.1f} ms  p95 {np.percentile(lat, 95):6.1f} ms  "
+          f"RSS totale {rss / 1024:7,.0f} MB  PSS totale {pss / 1024:7,.0f} MB", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput e memoria di serve.py al variare del numero di worker.")
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8, help="client concorrenti (processi)")
+    parser.add_argument("--duration", type=float, default=15.0, help="secondi di misura per configurazione")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--users-backend", choices=["json", "sqlite"], default="sqlite")
+    args = parser.parse_args()
+
+    if args.users_backend == "sqlite" and not config.USERS_DB_FILE.exists():
+        sys.exit(f"{config.USERS_DB_FILE} non trovato: eseguire prima backend/migrate_users.py")
+
+    print(f"== {os.cpu_count()} CPU, {args.clients} client, {args.duration:.0f} s per configurazione ==")
+    for workers in args.workers:
+        bench(workers, args)
+
+
+if __name__ == "__main__":
+    main()